@@ -7,56 +7,117 @@ The graph is interactive, allowing the user to click on nodes to see more detail
 
 from spoManager import SpotifyManager
 from graph import Graph
+from crawler import CollabCrawler
+from prefetcher import Prefetcher
+from jobs import JobQueue
+from sessionStore import SessionStore
+from artistStore import index_artist_songs
+from figureCache import data_version
+from metrics import metrics, profiled
+from datetime import datetime as dt
+import json
+import math
+import uuid
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
+from flask import Response
 
 dash_app = dash.Dash(__name__)
 
 ARTIST_URL_PREFIX = "https://open.spotify.com/artist/"
-spoManagerInstance = SpotifyManager(debug=True)
+spoManagerInstance = SpotifyManager(debug=True, workers=8)
 graphInstance = Graph()
-artist_data_store = {
-    "songs": {},
-    "artist_info": {},
-    "registered_songs": {}
-}
-
-dash_app.layout = html.Div(className="base-div", children=[
-    html.Div(className="input-button-container", children=[
-
-        html.Div(children=[
-            dcc.Input(
-                type="text", 
-                id="artist_link",
-                className="artist-input",
-                placeholder="Enter the artist name or link"
-            ),
-            html.Button("Generate graph", id="generate-button", className="generate-graph-button")
-        ]),
+crawlerInstance = CollabCrawler(spoManagerInstance, max_artists=30, debug=True)
+# Crawls the top collaborators of each served graph in the background
+prefetcherInstance = Prefetcher(spoManagerInstance, top_k=5, workers=2, debug=True)
+# Graphs are generated in the background, the browser polls the state of its job
+jobsInstance = JobQueue(workers=4)
+# Data of the graphs shown to each session, shared between the sessions showing the same graph
+sessionsInstance = SessionStore()
+# Songs shown on each page of the detail panel
+PANEL_PAGE_SIZE = 24
+
+
+def detail_pager(page=0, pages=1):
+    """
+    Builds the buttons that move between the pages of songs of the detail panel.
+
+    Parameters:
+    - page (int): The page shown, starting at 0.
+    - pages (int): The number of pages. The pager is hidden when there is only one.
+
+    Returns:
+    - html.Div: The pager.
+    """
+    return html.Div([
+        html.Button('‹', id='songs-prev', n_clicks=0, disabled=page <= 0, className="songs-pager-button"),
+        html.Span(f"{page + 1} / {pages}"),
+        html.Button('›', id='songs-next', n_clicks=0, disabled=page >= pages - 1, className="songs-pager-button")
+    ], className="songs-pager" if pages > 1 else "songs-pager-hidden")
+
+
+def serve_layout():
+    """
+    Builds the layout for each page load, so every page gets its own session ID.
+    """
+    return html.Div(className="base-div", children=[
+        html.Div(className="input-button-container", children=[
+
+            html.Div(children=[
+                dcc.Input(
+                    type="text", 
+                    id="artist_link",
+                    className="artist-input",
+                    placeholder="Enter the artist name or link"
+                ),
+                dcc.Input(
+                    type="number",
+                    id="hops",
+                    className="hops-input",
+                    min=0,
+                    max=3,
+                    step=1,
+                    value=0,
+                    placeholder="Hops"
+                ),
+                html.Button("Generate graph", id="generate-button", className="generate-graph-button"),
+                html.Div(id="job-status", className="job-status")
+            ]),
         
-    html.Div(id="artist-details", className="artist-details-div", children=[
-    ]),
+        html.Div(id="artist-details", className="artist-details-div", children=[
+        ]),
 
 
-    ]),
+        ]),
     
 
-    html.Div(className="graph-details-div", children=[
-        html.Div(id='graph-container', className="graph-container-div", children=[
-            dcc.Graph(id='artist-network', className="artist-network-graph"),
+        html.Div(className="graph-details-div", children=[
+            html.Div(id='graph-container', className="graph-container-div", children=[
+                dcc.Graph(id='artist-network', className="artist-network-graph"),
+            ]),
+
+            html.Div(id='click-data', className="click-data-div", children=[
+                html.Button('Generate graph for artist', id='gen-selec-artist', n_clicks=0, className="gen-selec-artist-hidden"),
+                html.Div(id='songs-list', children='Click on a node to see more details'),
+                detail_pager()
+            ])
         ]),
+        dcc.Store(id='selected-artist-id'),
+        dcc.Store(id='detail-page'),
+        dcc.Store(id='job-id'),
+        # Identifies the page in the server side session store, the graph shown is kept too so any worker can rebuild it
+        dcc.Store(id='session-id', data=uuid.uuid4().hex),
+        dcc.Store(id='graph-view'),
+        # The job whose preview is shown, so it is only sent once
+        dcc.Store(id='preview-job'),
+        dcc.Interval(id='job-poll', interval=500, disabled=True)
 
-        html.Div(id='click-data', className="click-data-div", children=[
-            html.Button('Generate graph for artist', id='gen-selec-artist', n_clicks=0, className="gen-selec-artist-hidden"),
-            html.Div(id='songs-list', children='Click on a node to see more details')
-        ])
-    ]),
-    dcc.Store(id='selected-artist-id')
+    ])
 
-])
 
+dash_app.layout = serve_layout
 
 
 
@@ -64,12 +125,16 @@ dash_app.layout = html.Div(className="base-div", children=[
 
 
 
-def process_artist_collabs(input_artist):
+
+def process_artist_collabs(input_artist, hops=0, progress=None, crawled_ids=None):
     """
     Process the artist collaborations.
 
     Args:
         input_artist (str): The input artist name.
+        hops (int): Number of hops of collaborators to crawl. 0 only uses the collaborations of the artist.
+        progress (callable, optional): Receives the progress of the crawl.
+        crawled_ids (list, optional): Receives the IDs of the crawled artists, see CollabCrawler.crawl.
 
     Returns:
         tuple: A tuple containing the following elements:
@@ -78,61 +143,129 @@ def process_artist_collabs(input_artist):
             - last_artist_collab (str): The last artist collaboration.
             - artist_data (dict): A dictionary of artist data.
             - artist_info (dict): A dictionary of artist information.
-            - artist_songs (dict): A dictionary of artist songs.
     """
-    total_artists, registered_songs, last_artist_collab, artist_data, artist_info = spoManagerInstance.getArtistCollabs(input_artist, False)
-    artist_songs = {}
+    # Background prefetches give way to the crawls requested by users
+    with prefetcherInstance.interactive():
+        if hops:
+            total_artists, registered_songs, last_artist_collab, artist_data, artist_info = crawlerInstance.crawl(input_artist, hops, progress, crawled_ids)
+        else:
+            total_artists, registered_songs, last_artist_collab, artist_data, artist_info = spoManagerInstance.getArtistCollabs(input_artist, False, progress=progress)
+            if crawled_ids is not None:
+                crawled_ids.append(artist_data["id"])
+
+    return total_artists, registered_songs, last_artist_collab, artist_data, artist_info
+
+
+def graph_data(view):
+    """
+    Returns the data shown when clicking the nodes of a graph.
 
-    for song, info_song in registered_songs.items():
-        for artists in info_song["collaborations"]:
-            for artist in artists:
-                artist_songs.setdefault(artist, []).append(song)
+    The data is kept in the session store under the root, the hops and the version of the graph. When it is
+    not there (evicted, or generated by another worker) it is rebuilt by merging the stored crawls of the
+    artists of the graph, so it has the nodes of the graph shown and makes no requests.
 
-    return total_artists, registered_songs, last_artist_collab, artist_data, artist_info, artist_songs
+    Args:
+        view (list): The graph shown, as returned by generate_graph_job: the ID of the root artist, the hops,
+                     the version of the data and the IDs of the crawled artists.
 
+    Returns:
+        dict: The artist information, the registered songs, the last collaboration dates and the version of the data.
+              It is shared with other sessions and must not be modified.
+    """
+    artist_id, hops, version, crawled_ids = view
+    key = (artist_id, hops, version)
+    data = sessionsInstance.get(key)
+    if data is None:
+        total_artists, registered_songs, last_artist_collab, _, artist_info = crawlerInstance.merge_stored(crawled_ids)
+        data = session_graph_data(total_artists, registered_songs, last_artist_collab, artist_info)
+        sessionsInstance.put(key, data)
+    return data
 
 
-@dash_app.callback(
-    [
-        Output('click-data', 'children'),
-        Output('selected-artist-id', 'data')
-    ],
-    [Input('artist-network', 'clickData')]
-)
-def display_click_data(clickData):
+def session_graph_data(total_artists, registered_songs, last_artist_collab, artist_info):
     """
-    Callback function that displays information based on the clicked data in the artist network.
+    Builds the data of a graph kept in the session store. Its version is a hash of the data, the entries
+    derived from it (song index, panels) are keyed by the version so a regenerated graph never shows stale ones.
+    """
+    return {
+        "artist_info": artist_info,
+        "registered_songs": registered_songs,
+        "last_artist_collab": last_artist_collab,
+        "version": data_version(total_artists, registered_songs, last_artist_collab, artist_info)
+    }
 
-    Parameters:
-    - clickData (dict): The data of the clicked node in the artist network.
+
+def graph_artist_songs(view):
+    """
+    Returns the songs, song count and last collaboration date of each artist of a graph.
+
+    The graph of a single artist uses the index stored with its crawl when the crawl has not changed since
+    the graph was generated, other graphs build it from their songs on the first click. It is kept in the
+    session store under the version of the graph data, so a regenerated graph gets a new index.
+
+    Args:
+        view (list): The graph shown, see graph_data.
 
     Returns:
-    - list: A list containing two elements:
-        - html.Div: The HTML div containing the artist details and gallery items.
-        - str: The ID of the clicked artist.
+        dict: The index built by artistStore.index_artist_songs. It is shared with other sessions and must not be modified.
     """
-    if not clickData:
-        return [html.Div([
-                html.Button('Generate graph for artist', id='gen-selec-artist', n_clicks=0, className="gen-selec-artist-hidden"),
-                html.Div('Click on a node to see more details')
-            ]), dash.no_update]
+    artist_id, hops, _, crawled_ids = view
+    data = graph_data(view)
+    key = ("artist_songs", artist_id, hops, data["version"])
+    artist_songs = sessionsInstance.get(key)
+    if artist_songs is None:
+        if len(crawled_ids) == 1:
+            stored = spoManagerInstance.store.load(crawled_ids[0], ["data_version", "artist_songs"])
+            # A refresh of the crawl after the graph was generated changes the version of the stored index
+            if stored and stored[0] == data["version"]:
+                artist_songs = stored[1]
+        if artist_songs is None:
+            artist_songs = index_artist_songs(data["registered_songs"], data["last_artist_collab"])
+        sessionsInstance.put(key, artist_songs)
+    return artist_songs
+
+
+def render_detail_panel(view, node_clicked_id, page):
+    """
+    Builds the details of an artist of a graph and one page of its songs.
 
-    node_clicked_id = clickData['points'][0]['customdata']
-    songs_list = artist_data_store["songs"].get(node_clicked_id, [])
+    Panels only depend on the graph data, the node and the page, so they are memoized in the session store
+    under the version of the data and shared by every session; clicking again on a node costs nothing.
+
+    Parameters:
+    - view (list): The graph shown, see graph_data.
+    - node_clicked_id (str): The ID of the clicked artist.
+    - page (int): The page of songs, starting at 0. Pages out of range show the closest one.
 
-    artist_image_url = artist_data_store["artist_info"].get(node_clicked_id, {}).get('url', 'URL_DEFAULT')
+    Returns:
+    - html.Div: The HTML div containing the artist details, the gallery items and the pager.
+    """
+    artist_id, hops = view[:2]
+    artist_data_store = graph_data(view)
+    artist_songs = graph_artist_songs(view).get(node_clicked_id, {})
+    songs_list = artist_songs.get("songs", [])
+    pages = max(1, math.ceil(len(songs_list) / PANEL_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+
+    key = ("panel", artist_id, hops, artist_data_store["version"], node_clicked_id, page)
+    panel = sessionsInstance.get(key)
+    if panel is not None:
+        return panel
+
+    artist_info = artist_data_store["artist_info"].get(node_clicked_id, {})
+    artist_image_url = artist_info.get('url', 'URL_DEFAULT')
     artist_image = html.Img(src=artist_image_url, className="artist-image-class")
 
     generate_button_for_artist = html.Button('Generate graph for artist', id='gen-selec-artist', n_clicks=0, className="gen-selec-artist-shown", **{'data-artist-id': node_clicked_id})
     
 
 
-    artist_name_display = artist_data_store["artist_info"][node_clicked_id]['name']
+    artist_name_display = artist_info.get('name', node_clicked_id)
     artist_spotify_url = ARTIST_URL_PREFIX + node_clicked_id
 
-    total_collaborations = artist_data_store["songs"][node_clicked_id]
-    last_collab_date = artist_data_store["last_artist_collab"].get(node_clicked_id, None)
-    genres_list = artist_data_store["artist_info"][node_clicked_id]['genres']
+    total_collaborations = artist_songs.get("count", 0)
+    last_collab_date = artist_songs.get("last_collab")
+    genres_list = artist_info.get('genres', [])
 
 
 
@@ -141,23 +274,24 @@ def display_click_data(clickData):
     artist_details_container = html.Div([
         html.Div([artist_name_link, generate_button_for_artist], className="artist-name-container"),
         html.Div([
-            html.Div(f"📀 Total: {len(total_collaborations)}"),
-            html.Div(f"📅 Last: {last_collab_date.strftime('%d-%m-%Y')}" if last_collab_date else ""),
+            html.Div(f"📀 Total: {total_collaborations}"),
+            html.Div(f"📅 Last: {dt.strptime(last_collab_date, '%Y-%m-%d').strftime('%d-%m-%Y')}" if last_collab_date else ""),
             html.Div(f"🎷Genres: {', '.join(genres_list)}" if genres_list else "") 
         ], style={'display': 'flex','justifyContent': 'space-around'})   
     ], className='artist-details-container')
 
 
     gallery_items = []
-    for song_id in songs_list:
+    for song_id in songs_list[page * PANEL_PAGE_SIZE:(page + 1) * PANEL_PAGE_SIZE]:
         song_info = artist_data_store["registered_songs"][song_id]
         song_title = html.Div(song_info['name'], className="song-title-class")
 
-        audio_preview = html.Audio(src=song_info['preview'], id=f"audio-{song_id}", controls=False) 
+        # Previews are only downloaded when played
+        audio_preview = html.Audio(src=song_info['preview'], id=f"audio-{song_id}", controls=False, preload="none")
 
-        song_thumbnail = html.Img(src=song_info['thumbnail'], 
-                             className="song-thumbnail",
-                             **{'data-song-id': song_id})
+        # script.js sets the source once the thumbnail scrolls into view
+        song_thumbnail = html.Img(className="song-thumbnail",
+                             **{'data-song-id': song_id, 'data-src': song_info['thumbnail']})
 
 
         song_item = html.Div([song_thumbnail, song_title, audio_preview], 
@@ -167,36 +301,208 @@ def display_click_data(clickData):
         gallery_item = html.A(song_item, href=song_info['url'], target="_blank", className="gallery-item")
         gallery_items.append(gallery_item)
 
-    return html.Div([artist_details_container] + gallery_items), node_clicked_id
+    panel = html.Div([artist_details_container] + gallery_items + [detail_pager(page, pages)])
+    sessionsInstance.put(key, panel)
+    return panel
 
 
 @dash_app.callback(
     [
-        Output('artist-network', 'figure'),
-        Output('artist-details', 'children')
+        Output('click-data', 'children'),
+        Output('selected-artist-id', 'data'),
+        Output('detail-page', 'data')
     ],
+    [
+        Input('artist-network', 'clickData'),
+        Input('songs-prev', 'n_clicks'),
+        Input('songs-next', 'n_clicks')
+    ],
+    [
+        State('session-id', 'data'),
+        State('graph-view', 'data'),
+        State('detail-page', 'data')
+    ]
+)
+def display_click_data(clickData, n_clicks_prev, n_clicks_next, session_id, graph_view, detail_page):
+    """
+    Callback function that displays information based on the clicked data in the artist network.
+
+    Parameters:
+    - clickData (dict): The data of the clicked node in the artist network.
+    - n_clicks_prev (int): Number of times the previous page button is clicked.
+    - n_clicks_next (int): Number of times the next page button is clicked.
+    - session_id (str): The ID of the session in the session store.
+    - graph_view (list): The graph shown, see graph_data.
+    - detail_page (dict): The node and the page shown in the panel.
+
+    Returns:
+    - list: A list containing three elements:
+        - html.Div: The HTML div containing the artist details and a page of gallery items.
+        - str: The ID of the clicked artist.
+        - dict: The node and the page shown.
+    """
+    ctx = dash.callback_context
+    button_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+    if button_id in ('songs-prev', 'songs-next'):
+        # The pager is rendered again with each panel, which triggers the callback without a click
+        if not (n_clicks_prev if button_id == 'songs-prev' else n_clicks_next) or not detail_page:
+            raise PreventUpdate
+
+    # The view kept by the page is the graph it shows, the one of the server may be left by an earlier graph
+    # served by this worker, so it is only used when the page has none
+    view = graph_view or sessionsInstance.view(session_id)
+    if graph_view:
+        sessionsInstance.set_view(session_id, graph_view)
+
+    if not clickData or view is None:
+        return [html.Div([
+                html.Button('Generate graph for artist', id='gen-selec-artist', n_clicks=0, className="gen-selec-artist-hidden"),
+                html.Div('Click on a node to see more details'),
+                detail_pager()
+            ]), dash.no_update, None]
+
+    if button_id in ('songs-prev', 'songs-next'):
+        node_clicked_id = detail_page["node"]
+        page = detail_page["page"] + (1 if button_id == 'songs-next' else -1)
+        selected_artist = dash.no_update
+    else:
+        node_clicked_id = clickData['points'][0]['customdata']
+        page = 0
+        selected_artist = node_clicked_id
+
+    panel = render_detail_panel(view, node_clicked_id, page)
+    return panel, selected_artist, {"node": node_clicked_id, "page": page}
+
+
+def preview_artist_id(input_artist):
+    """
+    Returns the ID of an artist given by ID or link that can be previewed, or None.
+    Names are not searched and stored artists are not previewed, their graph is ready as fast as the preview.
+    """
+    if not spoManagerInstance.index:
+        return None
+    if input_artist.startswith(ARTIST_URL_PREFIX):
+        artist_id = input_artist[len(ARTIST_URL_PREFIX):len(ARTIST_URL_PREFIX) + 22]
+    elif len(input_artist) == 22:
+        artist_id = input_artist
+    else:
+        return None
+    if spoManagerInstance.store.exists(artist_id):
+        return None
+    return artist_id
+
+
+def preview_figure(artist_id):
+    """
+    Renders the graph of the collaborators of an artist known by the collaboration index, shown while it is crawled.
+
+    Returns:
+        str: The figure, serialized as JSON, or None if the index knows no collaborators of the artist.
+    """
+    preview = spoManagerInstance.index.preview(artist_id)
+    if preview is None:
+        return None
+    total_artists, registered_songs, last_artist_collab, _, artist_info = preview
+    # Kept in the figure cache, every session polling the job renders it once
+    return graphInstance.generate_graph_json(total_artists, registered_songs, last_artist_collab, artist_info, root=artist_id)
+
+
+def generate_graph_job(job, input_artist, hops):
+    """
+    Crawls the collaborations of an artist and generates its graph, reporting the progress to the job.
+
+    Args:
+        job (Job): The handle of the job running the generation.
+        input_artist (str): The artist name, link or ID.
+        hops (int): Number of hops of collaborators to include in the graph.
+
+    Returns:
+        dict: The figure, serialized as JSON, the ID, name and image of the artist and the view of the graph.
+    """
+    artist_id = preview_artist_id(input_artist)
+    if artist_id and preview_figure(artist_id) is not None:
+        job.update(force=True, preview=artist_id)
+
+    crawled_ids = []
+    total_artists, registered_songs, last_artist_collab, artist_data, artist_info = process_artist_collabs(
+        input_artist, hops, job.update, crawled_ids)
+
+    job.update(force=True, stage="graph")
+    figure_json = graphInstance.generate_graph_json(total_artists, registered_songs, last_artist_collab, artist_info, hops,
+                                                    cache_key=artist_data["id"], root=artist_data["id"], progress=job.update)
+
+    data = session_graph_data(total_artists, registered_songs, last_artist_collab, artist_info)
+    sessionsInstance.put((artist_data["id"], hops, data["version"]), data)
+
+    # The next click is usually on one of the top collaborators, crawl them while the user explores the graph
+    prefetcherInstance.enqueue_collaborators(artist_data["id"], total_artists)
+
+    return {
+        # Kept serialized, it is only parsed when it is sent to the browser
+        "figure": figure_json,
+        "artist_id": artist_data["id"],
+        "artist_name": artist_info.get(artist_data["id"], {}).get('name', None),
+        "artist_image": artist_info.get(artist_data["id"], {}).get('url', None),
+        # Enough to rebuild the data of the graph on any worker, see graph_data
+        "view": [artist_data["id"], hops, data["version"], crawled_ids]
+    }
+
+
+def format_progress(progress):
+    """
+    Describes the progress of a graph generation job.
+
+    Parameters:
+    - progress (dict): The progress reported by the job.
+
+    Returns:
+    - str: A one line summary of the progress.
+    """
+    stage = progress.get("stage")
+    if stage == "layout":
+        return "Computing the layout..."
+    if stage in ("traces", "graph"):
+        return "Drawing the graph..."
+
+    parts = []
+    if progress.get("hop"):
+        parts.append(f"Hop {progress['hop']}, {progress.get('artists_crawled', 0)} artists crawled")
+    if stage == "artists":
+        parts.append(f"Fetching {progress.get('artists_total', 0)} collaborators")
+    elif "albums_total" in progress:
+        parts.append(f"Albums {progress.get('albums_paged', 0)}/{progress['albums_total']}")
+        parts.append(f"{progress.get('tracks_fetched', 0)} tracks fetched")
+    return " · ".join(parts) or "Crawling..."
+
+
+@dash_app.callback(
+    Output('job-id', 'data'),
     [
         Input('generate-button', 'n_clicks'),
         Input('gen-selec-artist', 'n_clicks')
     ],
     [
         State('artist_link', 'value'),
-        State('selected-artist-id', 'data')
+        State('selected-artist-id', 'data'),
+        State('hops', 'value')
     ]
 )
-def unified_update_graph(n_clicks_generate, n_clicks_selected, input_artist, artist_id):
+def unified_update_graph(n_clicks_generate, n_clicks_selected, input_artist, artist_id, hops):
     """
-    Callback function that updates the graph and artist details based on user interactions.
+    Callback function that starts the generation of a graph based on user interactions.
+
+    The crawl and the layout run in a background job, so the request returns at once
+    and the graph is delivered by poll_graph_job.
 
     Parameters:
     - n_clicks_generate (int): Number of times the generate button is clicked.
     - n_clicks_selected (int): Number of times the select artist button is clicked.
     - input_artist (str): The artist name entered by the user.
     - artist_id (str): The ID of the selected artist.
+    - hops (int): Number of hops of collaborators to include in the graph.
 
     Returns:
-    - fig (object): The updated graph figure.
-    - artist_details (list): The updated artist details.
+    - str: The ID of the job generating the graph.
     """
     ctx = dash.callback_context
 
@@ -211,33 +517,124 @@ def unified_update_graph(n_clicks_generate, n_clicks_selected, input_artist, art
     if button_id == 'generate-button':
         if not input_artist:
             raise PreventUpdate
-
-        total_artists, registered_songs, last_artist_collab, artist_data, artist_info, artist_songs = process_artist_collabs(input_artist)
+        artist = input_artist
     elif button_id == 'gen-selec-artist':
         if not artist_id:
             raise PreventUpdate
+        artist = artist_id
 
-        total_artists, registered_songs, last_artist_collab, artist_data, artist_info, artist_songs = process_artist_collabs(artist_id)
+    # Clicking again while the same graph is being generated joins the running job
+    return jobsInstance.submit(f"graph:{artist}:{hops or 0}", generate_graph_job, artist, hops or 0)
 
-    artist_data_store["songs"] = artist_songs
-    artist_data_store["artist_info"] = artist_info
-    artist_data_store["registered_songs"] = registered_songs
-    artist_data_store["last_artist_collab"] = last_artist_collab
 
-    fig = graphInstance.generate_graph(total_artists, registered_songs, last_artist_collab, artist_info, 0)
-    
-    artist_name = artist_data_store["artist_info"].get(artist_data["id"], {}).get('name', None) if artist_data else None
-    artist_image = artist_data_store["artist_info"].get(artist_data["id"], {}).get('url', None) if artist_data else None
+@dash_app.callback(
+    [
+        Output('artist-network', 'figure'),
+        Output('artist-details', 'children'),
+        Output('job-status', 'children'),
+        Output('job-poll', 'disabled'),
+        Output('graph-view', 'data'),
+        Output('preview-job', 'data')
+    ],
+    [
+        Input('job-poll', 'n_intervals'),
+        Input('job-id', 'data')
+    ],
+    [
+        State('session-id', 'data'),
+        State('preview-job', 'data')
+    ]
+)
+def poll_graph_job(n_intervals, job_id, session_id, preview_job):
+    """
+    Callback function that reports the progress of the graph job and shows the graph once it is done.
+    While the artist is crawled, the graph of its collaborators known by the collaboration index is shown instead.
+
+    Parameters:
+    - n_intervals (int): Number of times the job has been polled.
+    - job_id (str): The ID of the job generating the graph.
+    - session_id (str): The ID of the session in the session store.
+    - preview_job (str): The ID of the job whose preview is shown.
 
+    Returns:
+    - fig (object): The preview of the graph while the job runs, and the generated graph once it is done.
+    - artist_details (list): The updated artist details, once the job is done.
+    - status (str): The progress of the job.
+    - disabled (bool): Whether polling stops.
+    - graph_view (list): The graph shown once the job is done, see graph_data.
+    - preview_job (str): The ID of the job whose preview is shown.
+    """
+    if not job_id:
+        raise PreventUpdate
+
+    job = jobsInstance.status(job_id)
+    if job is None:
+        return dash.no_update, dash.no_update, "", True, dash.no_update, dash.no_update
+    if job["state"] == "failed":
+        return dash.no_update, dash.no_update, f"Error: {job['error']}", True, dash.no_update, dash.no_update
+    if job["state"] != "done":
+        preview_id = job["progress"].get("preview")
+        if preview_id and preview_job != job_id:
+            figure_json = preview_figure(preview_id)
+            if figure_json is not None:
+                # The nodes of the preview have no songs to show until the graph is done
+                sessionsInstance.set_view(session_id, None)
+                return json.loads(figure_json), [], format_progress(job["progress"]), False, None, job_id
+        return dash.no_update, dash.no_update, format_progress(job["progress"]), False, dash.no_update, dash.no_update
+
+    result = job["result"]
+    # Jobs are shared by the sessions requesting the same graph, each one points to its data here
+    sessionsInstance.set_view(session_id, result["view"])
+    artist_name = result["artist_name"]
+    artist_image = result["artist_image"]
 
     artist_details = []
     if artist_name and artist_image:
         artist_details.append(html.Div(artist_name, className="artist-name-detail"))
         artist_details.append(html.Img(src=artist_image, alt=artist_name, className="artist-image-detail"))
 
+    return json.loads(result["figure"]), artist_details, "", True, result["view"], job_id
+
+
+# Routes the requests are labelled with in the metrics, any other path is labelled "other"
+ROUTE_LABELS = ["/", "/_dash-update-component", "/_dash-layout", "/_dash-dependencies", "/metrics"]
+ROUTE_PREFIXES = ["/assets", "/_dash-component-suites"]
+
+
+def route_label(path):
+    """
+    Returns the route of a request path among a fixed set, so scanners and versioned assets do not create new series.
+    """
+    if path in ROUTE_LABELS:
+        return path
+    for prefix in ROUTE_PREFIXES:
+        if path.startswith(prefix + "/"):
+            return prefix
+    return "other"
+
+
+class InstrumentedApp:
+    """
+    WSGI middleware timing every request by route, and profiling it when the profileDir environment variable is set.
+    """
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        route = route_label(environ.get("PATH_INFO", ""))
+        with metrics.timer("http_request_seconds", path=route), profiled(f"request-{route}"):
+            return self.wsgi_app(environ, start_response)
 
 
-    return fig, artist_details
+dash_app.server.wsgi_app = InstrumentedApp(dash_app.server.wsgi_app)
+
+
+@dash_app.server.route("/metrics")
+def prometheus_metrics():
+    """
+    Exposes the counters and timers of the application in the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
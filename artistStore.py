@@ -0,0 +1,220 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from figureCache import data_version
+
+STORE_PATH = os.path.join(".", "data", "artists.sqlite3")
+
+# Folders written by the crawls before the store existed, one JSON file per field
+LEGACY_ARTIST_PATH = os.path.join(".", "data", "{}")
+LEGACY_FILES = {
+    "total_artists": "totalArtists.json",
+    "registered_songs": "registeredSongs.json",
+    "last_collab": "lastCollab.json",
+    "artist_data": "artistData.json",
+    "artist_info": "artistInfo.json",
+    "processed_albums": "processedAlbums.json",
+}
+
+# Fields returned by load, in the same order as the getArtistCollabs tuple
+COLLAB_FIELDS = ["total_artists", "registered_songs", "last_collab", "artist_data", "artist_info"]
+FIELDS = COLLAB_FIELDS + ["processed_albums"]
+# Fields derived from the others, added after the first version of the store, so they may be missing.
+# data_version is the figureCache.data_version of the crawl, the version of the graph of the artist alone.
+DERIVED_FIELDS = ["artist_songs", "data_version"]
+
+
+def index_artist_songs(registered_songs, last_collab):
+    """
+    Builds the inverted index of the songs in which each artist takes part.
+
+    Parameters:
+        registered_songs (dict): The songs of a crawl, as returned by getArtistCollabs.
+        last_collab (dict): The last collaboration date of each artist, as YYYY-MM-DD strings.
+
+    Returns:
+        dict: For each artist, the IDs of its songs in the order of registered_songs, their count
+              and the date of its last collaboration (None for the crawled artist).
+    """
+    index = {}
+    for song_id, song in registered_songs.items():
+        for artists in song["collaborations"]:
+            for a_id in artists:
+                entry = index.setdefault(a_id, {"songs": [], "count": 0, "last_collab": last_collab.get(a_id)})
+                if not entry["songs"] or entry["songs"][-1] != song_id:
+                    entry["songs"].append(song_id)
+                    entry["count"] += 1
+    return index
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode(), 1)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class ArtistStore:
+    """
+    Stores the crawled data of every artist in a single SQLite database, one row per artist.
+
+    Each field is kept as compressed JSON in its own column, so a field can be read
+    without decoding the others. Writes of an artist happen in a single transaction.
+    """
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"""CREATE TABLE IF NOT EXISTS artists (
+                                    id TEXT PRIMARY KEY,
+                                    {", ".join(f"{field} BLOB NOT NULL" for field in FIELDS)},
+                                    updated REAL NOT NULL,
+                                    {", ".join(f"{field} BLOB" for field in DERIVED_FIELDS)})""")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(artists)")}
+            for field in DERIVED_FIELDS:
+                if field not in columns:
+                    self._conn.execute(f"ALTER TABLE artists ADD COLUMN {field} BLOB")
+
+    def exists(self, artist_id):
+        """
+        Returns True if the artist has been stored (or can be imported from a legacy folder).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM artists WHERE id = ?", (artist_id,)).fetchone()
+        return row is not None or self._import_legacy(artist_id)
+
+    def load(self, artist_id, fields=COLLAB_FIELDS):
+        """
+        Loads the stored data of an artist.
+
+        Parameters:
+            artist_id (str): The ID of the artist.
+            fields (list): The fields to load. Defaults to the fields returned by getArtistCollabs.
+                           "artist_songs" loads the index built by index_artist_songs and "data_version"
+                           the version of the data it was built from.
+
+        Returns:
+            tuple: The values of the requested fields, or None if the artist is not stored.
+        """
+        columns = ", ".join(fields)
+        with self._lock:
+            row = self._conn.execute(f"SELECT {columns} FROM artists WHERE id = ?", (artist_id,)).fetchone()
+        if row is None:
+            if not self._import_legacy(artist_id):
+                return None
+            return self.load(artist_id, fields)
+        values = []
+        for field, blob in zip(fields, row):
+            if blob is None:
+                # Artists stored before the field existed get it built on first use
+                blob = self._build_derived(artist_id)[field]
+            values.append(_unpack(blob))
+        return tuple(values)
+
+    def save(self, artist_id, total_artists, registered_songs, last_collab, artist_data, artist_info, processed_albums,
+             artist_songs=None):
+        """
+        Atomically stores (or replaces) the data of an artist.
+        The index of the songs of each artist is built from the songs unless it is given.
+        """
+        if artist_songs is None:
+            artist_songs = index_artist_songs(registered_songs, last_collab)
+        version = data_version(total_artists, registered_songs, last_collab, artist_info)
+        columns = ["id"] + FIELDS + ["updated"] + DERIVED_FIELDS
+        values = [total_artists, registered_songs, last_collab, artist_data, artist_info, processed_albums]
+        row = [artist_id] + [_pack(value) for value in values] + [time.time(), _pack(artist_songs), _pack(version)]
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO artists ({', '.join(columns)}) VALUES ({', '.join('?' * len(row))})",
+                               row)
+
+    def _build_derived(self, artist_id):
+        """
+        Builds and stores the derived fields of an artist saved without them.
+
+        Returns:
+            dict: The packed value of each derived field.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT total_artists, registered_songs, last_collab, artist_info FROM artists WHERE id = ?",
+                                     (artist_id,)).fetchone()
+        total_artists, registered_songs, last_collab, artist_info = map(_unpack, row)
+        blobs = {"artist_songs": _pack(index_artist_songs(registered_songs, last_collab)),
+                 "data_version": _pack(data_version(total_artists, registered_songs, last_collab, artist_info))}
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE artists SET artist_songs = ?, data_version = ? WHERE id = ?",
+                               (blobs["artist_songs"], blobs["data_version"], artist_id))
+        return blobs
+
+    def artist_ids(self):
+        """
+        Returns the IDs of every stored artist.
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM artists")]
+
+    def _import_legacy(self, artist_id, folder=None):
+        """
+        Imports the legacy folder of an artist into the store if it exists and is complete.
+
+        Parameters:
+            artist_id (str): The ID of the artist.
+            folder (str, optional): The folder of the artist. Defaults to "data/<artist_id>".
+
+        Returns:
+            bool: True if the artist was imported.
+        """
+        folder = folder or LEGACY_ARTIST_PATH.format(artist_id)
+        paths = {field: os.path.join(folder, filename) for field, filename in LEGACY_FILES.items()}
+        if not all(os.path.exists(paths[field]) for field in COLLAB_FIELDS):
+            return False
+
+        values = {}
+        for field, path in paths.items():
+            if os.path.exists(path):
+                with open(path) as json_file:
+                    values[field] = json.load(json_file)
+        # Folders crawled before the incremental updates have no list of processed albums
+        values.setdefault("processed_albums", {})
+        self.save(artist_id, **values)
+        return True
+
+    def migrate(self, data_dir=os.path.join(".", "data"), remove=False):
+        """
+        Imports every legacy artist folder found in `data_dir`.
+
+        Parameters:
+            data_dir (str): The folder containing one subfolder per artist.
+            remove (bool): If True, the folders are deleted once imported.
+
+        Returns:
+            int: The number of imported artists.
+        """
+        imported = 0
+        for name in sorted(os.listdir(data_dir)):
+            folder = os.path.join(data_dir, name)
+            if not os.path.isdir(folder) or not self._import_legacy(name, folder):
+                continue
+            imported += 1
+            if remove:
+                shutil.rmtree(folder)
+        return imported
+
+
+if __name__ == '__main__':
+    # Usage: python artistStore.py migrate [data_dir] [--remove]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not args or args[0] != "migrate":
+        print("Usage: python artistStore.py migrate [data_dir] [--remove]")
+        sys.exit(1)
+    data_dir = args[1] if len(args) > 1 else os.path.join(".", "data")
+    count = ArtistStore(os.path.join(data_dir, "artists.sqlite3")).migrate(data_dir, remove="--remove" in sys.argv)
+    print(f"Migrated {count} artists")
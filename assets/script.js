@@ -27,4 +27,29 @@ document.body.addEventListener('mouseout', function(event) {
         let audioId = 'audio-' + event.target.dataset.songId;
         pauseAudio(audioId);
     }
-});
\ No newline at end of file
+});
+
+// Song thumbnails keep their image in data-src until they scroll into view
+const thumbnailObserver = new IntersectionObserver(function(entries, observer) {
+    entries.forEach(function(entry) {
+        if(entry.isIntersecting) {
+            entry.target.src = entry.target.dataset.src;
+            observer.unobserve(entry.target);
+        }
+    });
+});
+
+/**
+ * Starts observing the song thumbnails that have not been loaded yet.
+ * @param {Node} root - The node containing the thumbnails.
+ */
+function observeThumbnails(root) {
+    root.querySelectorAll('img.song-thumbnail[data-src]:not([src])').forEach(function(img) {
+        thumbnailObserver.observe(img);
+    });
+}
+
+// The detail panel is rendered by Dash, so new thumbnails are picked up as they are added
+new MutationObserver(function() {
+    observeThumbnails(document.body);
+}).observe(document.body, {childList: true, subtree: true});
@@ -0,0 +1,83 @@
+"""
+Measures the crawl and the render of synthetic artists of growing size, served by fakeSpotify.FakeSpotify.
+
+For each number of collaborators it reports:
+    - the wall time and the number of API calls of SpotifyManager.getArtistCollabs on an empty store,
+    - the time and the peak memory (measured with tracemalloc in a second run) of Graph.generate_graph.
+
+Usage: python benchmarks/bench_crawl_render.py [sizes...] [--latency SECONDS] [--workers N] [--layout ENGINE]
+                                                 [--editions N]
+
+The stores and caches are created in a temporary folder, so every run starts cold and nothing is written to data/.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("graphizRoute", "")
+from artistStore import ArtistStore
+from crawlLock import CrawlLocks
+from fakeSpotify import FakeSpotify, ROOT_ARTIST_ID
+from graph import Graph, LAYOUT_ENGINES
+from spoManager import SpotifyManager
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def bench_crawl(folder, collaborators, latency, workers, editions=1):
+    """
+    Crawls the main artist of a synthetic discography.
+
+    Returns:
+        tuple: The data returned by getArtistCollabs, the wall time and the number of API calls.
+    """
+    client = FakeSpotify(collaborators=collaborators, latency=latency, editions=editions)
+    manager = SpotifyManager(workers=workers, response_cache=False, collab_index=False, client=client,
+                             store=ArtistStore(os.path.join(folder, f"artists-{collaborators}.sqlite3")),
+                             crawl_locks=CrawlLocks(os.path.join(folder, "crawls.lock")), governor=False)
+    start = time.perf_counter()
+    data = manager.getArtistCollabs(ROOT_ARTIST_ID)
+    return data, time.perf_counter() - start, manager.api_calls
+
+
+def bench_render(graph, data, layout):
+    """
+    Renders the graph of a crawl.
+
+    Returns:
+        tuple: The time of the first render and the peak memory in MB of the second one.
+    """
+    total_artists, registered_songs, last_collab, artist_data, artists_info = data
+    args = (total_artists, registered_songs, last_collab, artists_info, 0, layout, None, artist_data["id"])
+    start = time.perf_counter()
+    graph.generate_graph(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    graph.generate_graph(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_SIZES, help="Numbers of collaborators")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency of each API call")
+    parser.add_argument("--workers", type=int, default=8, help="Workers of the SpotifyManager")
+    parser.add_argument("--editions", type=int, default=1, help="Editions of each album of the main artist")
+    parser.add_argument("--layout", default="auto", choices=LAYOUT_ENGINES, help="Layout engine of the renders")
+    args = parser.parse_args()
+
+    # Layouts and figures are not cached, every render computes them
+    graph = Graph(layout_cache=False, figure_cache=False)
+    print(f"{'collaborators':>13} {'crawl (s)':>10} {'API calls':>10} {'render (s)':>11} {'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory() as folder:
+        for n in sorted(args.sizes):
+            data, crawl_time, api_calls = bench_crawl(folder, n, args.latency, args.workers, args.editions)
+            render_time, peak = bench_render(graph, data, args.layout)
+            print(f"{n:>13} {crawl_time:>10.3f} {api_calls:>10} {render_time:>11.3f} {peak:>10.1f}")
@@ -0,0 +1,103 @@
+"""
+Compares the construction of the Plotly traces of Graph.generate_graph with the previous
+implementation, which appended every point to the traces one by one.
+
+Usage: python benchmarks/bench_traces.py [sizes...]
+
+The previous implementation is quadratic, above LEGACY_MAX_NODES its time is extrapolated
+from the largest measured size instead of measured (set the variable to measure anyway).
+"""
+import math
+import os
+import sys
+import time
+from datetime import datetime as dt
+
+import networkx as nx
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("graphizRoute", "")
+from graph import Graph
+
+DEFAULT_SIZES = [100, 1000, 10000]
+LEGACY_MAX_NODES = int(os.getenv("LEGACY_MAX_NODES", 3000))
+
+
+def build_data(n):
+    """
+    Builds a star graph of n nodes with the data generate_graph works with, placed on a circle.
+    """
+    root = "root"
+    G = nx.Graph()
+    G.add_node(root)
+    total_artists = {root: n}
+    last_collab_artist = {}
+    artists_info = {root: {"name": "Root artist", "genres": []}}
+    for i in range(1, n):
+        artist = f"artist{i}"
+        G.add_edge(root, artist)
+        total_artists[artist] = i % 17 + 1
+        last_collab_artist[artist] = dt(2000 + i % 23, 1 + i % 12, 1 + i % 28)
+        artists_info[artist] = {"name": f"Artist {i}", "genres": []}
+    pos = {node: (math.cos(2 * math.pi * i / n), math.sin(2 * math.pi * i / n)) for i, node in enumerate(G.nodes())}
+    sizes = [10] * n
+    colors = ["#000000"] * n
+    return G, pos, sizes, colors, total_artists, last_collab_artist, artists_info, root
+
+
+def legacy_traces(G, pos, node_sizes, colors, total_artists, last_collab_artist, artists_info, root):
+    edge_trace = go.Scatter(x=[], y=[], line=dict(width=1, color='black'), hoverinfo='none', mode='lines')
+    for edge in G.edges():
+        x0, y0 = pos[edge[0]]
+        x1, y1 = pos[edge[1]]
+        edge_trace['x'] += (x0, x1, None)
+        edge_trace['y'] += (y0, y1, None)
+
+    node_trace = go.Scatter(x=[], y=[], text=[], mode='markers', customdata=[], hoverinfo='text',
+                            marker=dict(showscale=False, colorscale='YlGnBu', size=node_sizes, line_width=2))
+    node_trace.marker.color = colors
+    label_trace = go.Scatter(x=[], y=[], text=[], mode='text', hoverinfo='none',
+                             textfont=dict(family="sans serif", size=12, color="black"))
+    for node in G.nodes():
+        x, y = pos[node]
+        node_trace['x'] += (x,)
+        node_trace['y'] += (y,)
+        artist_name = artists_info[node]['name']
+        if node == root:
+            node_label = "{}\nCollabs: {}".format(artist_name, total_artists[node])
+        else:
+            node_label = "{}\nCollabs: {}\nLast: {}".format(artist_name, total_artists[node],
+                                                             last_collab_artist[node].strftime('%d-%m-%Y'))
+        node_trace['text'] += (node_label,)
+        node_trace['customdata'] += (node,)
+        label_trace['x'] += (x,)
+        label_trace['y'] += (y,)
+        label_trace['text'] += (artist_name,)
+    return edge_trace, node_trace, label_trace
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    # The level of detail is disabled so every node gets its label in SVG traces, as in the previous implementation,
+    # and nothing is cached in the working directory
+    graph = Graph(layout_cache=False, figure_cache=False, lod_nodes=max(sizes) + 1)
+    print(f"{'nodes':>8} {'legacy (s)':>12} {'single pass (s)':>16} {'speedup':>8}")
+    measured = None
+    for n in sorted(sizes):
+        data = build_data(n)
+        current = timed(graph._build_traces, *data)
+        if n <= LEGACY_MAX_NODES or measured is None:
+            legacy = timed(legacy_traces, *data)
+            measured = (n, legacy)
+            mark = " "
+        else:
+            legacy = measured[1] * (n / measured[0]) ** 2
+            mark = "~"
+        print(f"{n:>8} {mark}{legacy:>11.3f} {current:>16.3f} {legacy / current:>8.1f}x")
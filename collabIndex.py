@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+INDEX_PATH = os.path.join(".", "data", "collab_index.sqlite3")
+
+
+class CollabIndex:
+    """
+    Global index of the collaborations found by every crawl.
+
+    It keeps the song to artists and artist to songs postings, an adjacency list with the
+    number of songs shared by each pair of artists and the date of their last one, and the name,
+    image and genres of every artist seen. It is updated after each crawl and answers who an artist has collaborated
+    with without any request to the API.
+    """
+    def __init__(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS song_artists (
+                                    song_id TEXT NOT NULL,
+                                    artist_id TEXT NOT NULL,
+                                    PRIMARY KEY (song_id, artist_id))""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS song_artists_artist ON song_artists (artist_id)")
+            # Both directions of every pair are stored, so the neighbours of an artist are a prefix scan
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS edges (
+                                    artist_id TEXT NOT NULL,
+                                    other_id TEXT NOT NULL,
+                                    songs INTEGER NOT NULL,
+                                    last_collab TEXT,
+                                    PRIMARY KEY (artist_id, other_id))""")
+            # Indexes created before the dates of the pairs get them from `python collabIndex.py rebuild`
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(edges)")}
+            if "last_collab" not in columns:
+                self._conn.execute("ALTER TABLE edges ADD COLUMN last_collab TEXT")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS artists (
+                                    artist_id TEXT PRIMARY KEY,
+                                    name TEXT,
+                                    url TEXT,
+                                    genres TEXT NOT NULL,
+                                    last_collab TEXT)""")
+
+    def add_crawl(self, artist_id, registered_songs, last_collab_artist, artists_info):
+        """
+        Adds the results of a crawl to the index. Songs already indexed only add their new artists,
+        so adding the same crawl twice does not change the counts.
+
+        The last collaboration of a pair is the latest release date of their songs. Songs saved without
+        their release date only date the pairs of the crawled artist, from last_collab_artist.
+
+        Parameters:
+            artist_id (str): The ID of the crawled artist.
+            registered_songs (dict): The songs of the crawl, as returned by getArtistCollabs.
+            last_collab_artist (dict): The last collaboration date of each artist, as YYYY-MM-DD strings.
+            artists_info (dict): The name, image and genres of each artist.
+        """
+        song_artists = {}
+        for song_id, song in registered_songs.items():
+            artists = song_artists.setdefault(song_id, set(song["artists"]))
+            for collaboration in song["collaborations"]:
+                artists.update(collaboration)
+
+        pair_dates = {}
+        for other_id, date in last_collab_artist.items():
+            for pair in ((artist_id, other_id), (other_id, artist_id)):
+                pair_dates[pair] = date
+        for song_id, song in registered_songs.items():
+            date = song.get("release_date")
+            if not date:
+                continue
+            for a_id in song_artists[song_id]:
+                for other_id in song_artists[song_id]:
+                    if other_id != a_id and date > pair_dates.get((a_id, other_id), ""):
+                        pair_dates[(a_id, other_id)] = date
+
+        with self._lock, self._conn:
+            song_ids = list(song_artists)
+            indexed = {}
+            for i in range(0, len(song_ids), 500):
+                ids_chunk = song_ids[i:i+500]
+                rows = self._conn.execute(
+                    f"SELECT song_id, artist_id FROM song_artists WHERE song_id IN ({','.join('?' * len(ids_chunk))})",
+                    ids_chunk)
+                for song_id, artist_id in rows:
+                    indexed.setdefault(song_id, set()).add(artist_id)
+
+            new_postings = []
+            edge_increments = {}
+            for song_id, artists in song_artists.items():
+                old_artists = indexed.get(song_id, set())
+                new_artists = artists - old_artists
+                new_postings.extend((song_id, artist_id) for artist_id in new_artists)
+                # Every pair with at least one new artist shares one more song
+                for artist_id in new_artists:
+                    for other_id in artists:
+                        if other_id == artist_id or (other_id in new_artists and other_id < artist_id):
+                            continue
+                        for pair in ((artist_id, other_id), (other_id, artist_id)):
+                            edge_increments[pair] = edge_increments.get(pair, 0) + 1
+
+            self._conn.executemany("INSERT OR IGNORE INTO song_artists VALUES (?, ?)", new_postings)
+            # Pairs of songs indexed by a previous crawl only update their date
+            self._conn.executemany("""INSERT INTO edges VALUES (?, ?, ?, ?)
+                                      ON CONFLICT (artist_id, other_id) DO UPDATE SET
+                                        songs = songs + excluded.songs,
+                                        last_collab = NULLIF(MAX(COALESCE(last_collab, ''), COALESCE(excluded.last_collab, '')), '')""",
+                                   [(a, b, edge_increments.get((a, b), 0), pair_dates.get((a, b)))
+                                    for (a, b) in edge_increments.keys() | pair_dates.keys()])
+            self._conn.executemany("""INSERT INTO artists VALUES (?, ?, ?, ?, ?)
+                                      ON CONFLICT (artist_id) DO UPDATE SET
+                                        name = excluded.name, url = excluded.url, genres = excluded.genres,
+                                        last_collab = MAX(COALESCE(last_collab, ''), COALESCE(excluded.last_collab, ''))""",
+                                   [(artist_id, info.get("name"), info.get("url"), json.dumps(info.get("genres") or []),
+                                     last_collab_artist.get(artist_id)) for artist_id, info in artists_info.items()])
+
+    def collaborators(self, artist_id):
+        """
+        Returns the artists that have collaborated with an artist.
+
+        Returns:
+            dict: The number of shared songs with each collaborator, the most frequent first.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT other_id, songs FROM edges WHERE artist_id = ? ORDER BY songs DESC",
+                                      (artist_id,)).fetchall()
+        return dict(rows)
+
+    def last_collabs(self, artist_id):
+        """
+        Returns the date of the last song of an artist with each of its collaborators, as YYYY-MM-DD strings.
+        Collaborators whose songs were indexed without a date are left out.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT other_id, last_collab FROM edges WHERE artist_id = ? AND last_collab IS NOT NULL",
+                                      (artist_id,)).fetchall()
+        return dict(rows)
+
+    def song_count(self, artist_id):
+        """
+        Returns the number of indexed songs in which an artist takes part.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM song_artists WHERE artist_id = ?", (artist_id,)).fetchone()[0]
+
+    def songs_of(self, artist_id):
+        """
+        Returns the IDs of the indexed songs in which an artist takes part.
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT song_id FROM song_artists WHERE artist_id = ?", (artist_id,))]
+
+    def artists_of(self, song_id):
+        """
+        Returns the IDs of the artists of an indexed song.
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT artist_id FROM song_artists WHERE song_id = ?", (song_id,))]
+
+    def artist_info(self, artist_ids):
+        """
+        Returns the name, image, genres and latest known collaboration date of the given artists.
+        """
+        artist_ids = list(artist_ids)
+        info = {}
+        with self._lock:
+            for i in range(0, len(artist_ids), 500):
+                ids_chunk = artist_ids[i:i+500]
+                rows = self._conn.execute(
+                    f"SELECT artist_id, name, url, genres, last_collab FROM artists WHERE artist_id IN ({','.join('?' * len(ids_chunk))})",
+                    ids_chunk)
+                for artist_id, name, url, genres, last_collab in rows:
+                    info[artist_id] = {"name": name, "url": url, "genres": json.loads(genres), "last_collab": last_collab or None}
+        return info
+
+    def preview(self, artist_id):
+        """
+        Builds the data of the graph of an artist from the index alone, to show it before it is crawled.
+
+        Returns:
+            tuple: total_artists, registered_songs (empty), last_collab_artist, artist_response and artists_info
+                   in the format of getArtistCollabs, or None if the artist has no known collaborators.
+        """
+        collaborators = self.collaborators(artist_id)
+        info = self.artist_info([artist_id] + list(collaborators))
+        if not collaborators or artist_id not in info:
+            return None
+        # The dates of the pairs, the last collaboration of each artist may be with someone else
+        last_collabs = self.last_collabs(artist_id)
+        collaborators = {other_id: songs for other_id, songs in collaborators.items()
+                         if other_id in info and other_id in last_collabs}
+        if not collaborators:
+            return None
+
+        total_artists = dict(collaborators)
+        total_artists[artist_id] = len(self.songs_of(artist_id))
+        last_collab_artist = {other_id: last_collabs[other_id] for other_id in collaborators}
+        artists_info = {a_id: {key: value for key, value in data.items() if key != "last_collab"} for a_id, data in info.items()}
+        artist_response = {"id": artist_id, "name": info[artist_id]["name"]}
+        return total_artists, {}, last_collab_artist, artist_response, artists_info
+
+    def rebuild(self, store):
+        """
+        Indexes every artist of an ArtistStore.
+
+        Returns:
+            int: The number of indexed artists.
+        """
+        artist_ids = store.artist_ids()
+        for artist_id in artist_ids:
+            _, registered_songs, last_collab, _, artists_info = store.load(artist_id)
+            self.add_crawl(artist_id, registered_songs, last_collab, artists_info)
+        return len(artist_ids)
+
+
+if __name__ == '__main__':
+    # Usage: python collabIndex.py rebuild
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python collabIndex.py rebuild")
+        sys.exit(1)
+    from artistStore import ArtistStore
+    print(f"Indexed {CollabIndex().rebuild(ArtistStore())} artists")
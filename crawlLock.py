@@ -0,0 +1,57 @@
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, crawls are then only coordinated between the threads of a process
+    fcntl = None
+
+CRAWL_LOCK_PATH = os.path.join(".", "data", "crawls.lock")
+
+# Number of locks the artists are spread over
+CRAWL_LOCK_STRIPES = 1024
+
+
+class CrawlLocks:
+    """
+    Single-flight locks of the artist crawls, shared by the threads and the processes using the same lock file.
+
+    Each artist maps to one of `stripes` locks: a threading.Lock for the threads of the process and
+    a lock on one byte of the lock file for the other processes. Holding the lock of an artist while
+    crawling it makes the concurrent requests for the same artist wait for that crawl, instead of
+    crawling it again, and then read its result from the store. Two artists may share a stripe,
+    which only makes one of them wait.
+    """
+    def __init__(self, path=CRAWL_LOCK_PATH, stripes=CRAWL_LOCK_STRIPES):
+        """
+        Parameters:
+            path (str): Path of the lock file. Defaults to "data/crawls.lock".
+            stripes (int): Number of locks. Defaults to CRAWL_LOCK_STRIPES.
+        """
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._fd = None
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Kept open for the life of the process: closing any descriptor of the file would release its locks
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def hold(self, artist_id):
+        """
+        Context manager holding the lock of an artist, waiting for the crawl that holds it if any.
+        """
+        stripe = zlib.crc32(artist_id.encode()) % self.stripes
+        # Locks on the file belong to the process, so the threads first take turns on the thread lock
+        with self._locks[stripe]:
+            if self._fd is None:
+                yield
+                return
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
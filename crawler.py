@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import threading
+
+from spoManager import on_requests
+
+
+class CollabCrawler:
+    """
+    Crawls the collaboration network of an artist several hops deep.
+
+    The artists are visited breadth first: every hop is finished before the next one starts,
+    and inside a hop the artists with more collaborations are crawled first, using the global
+    collaboration index of the manager, when it has one, to count them across every crawl. Each artist is
+    crawled through SpotifyManager.getArtistCollabs, so the artists already stored cost no requests.
+    """
+    def __init__(self, spotify_manager, max_artists=50, max_api_calls=None, debug=False):
+        """
+        Parameters:
+            spotify_manager (SpotifyManager): The manager used to crawl each artist.
+            max_artists (int): Maximum number of artists to crawl, the root included.
+            max_api_calls (int, optional): Maximum number of requests to the Spotify API sent by each crawl, checked
+                                           before crawling each artist. Unlimited by default.
+            debug (bool): If True, prints the progress of the crawl.
+        """
+        self.spotify_manager = spotify_manager
+        self.max_artists = max_artists
+        self.max_api_calls = max_api_calls
+        self.debug = debug
+
+    def _budget_exhausted(self, crawled, used_calls):
+        if len(crawled) >= self.max_artists:
+            return True
+        return self.max_api_calls is not None and used_calls >= self.max_api_calls
+
+    def crawl(self, artist_id, depth=1, progress=None, crawled_ids=None):
+        """
+        Crawls the artist and its collaborators up to `depth` hops away and merges the results.
+
+        Parameters:
+            artist_id (str): The ID, link or name of the root artist.
+            depth (int): Number of hops to follow from the root artist. 0 only crawls the root.
+            progress (callable, optional): Receives the progress of each artist crawl (see getArtistCollabs),
+                                           plus the hop and the number of artists crawled and queued.
+            crawled_ids (list, optional): Receives the IDs of the crawled artists in the order they are merged,
+                                          merge_stored rebuilds the same data from them.
+
+        Returns:
+            tuple: The merged data, in the same format as SpotifyManager.getArtistCollabs:
+                - total_artists (dict): The number of songs of each artist.
+                - registered_songs (dict): Every song found, with all its collaborations.
+                - last_collab_artist (dict): The date of the last collaboration of each artist.
+                - artist_response (dict): Information about the root artist, its ID is the root of the merged graph.
+                - artists_info (dict): Information about every artist in the graph.
+        """
+        # Requests sent by this crawl, the manager is shared with the crawls of other threads
+        used_calls = [0]
+        used_calls_lock = threading.Lock()
+
+        def count_call():
+            with used_calls_lock:
+                used_calls[0] += 1
+
+        with on_requests(count_call):
+            root_data = self.spotify_manager.getArtistCollabs(artist_id, progress=progress)
+        root_id = root_data[3]["id"]
+        artist_response = root_data[3]
+
+        merged = {}, {}, {}, {}
+        crawled = set()
+        # Entries are (hop, -collaborations, order, artist_id), the order breaks ties in discovery order
+        frontier = []
+        order = itertools.count()
+        queued = {root_id}
+
+        def merge(crawled_id, hop, data):
+            crawled.add(crawled_id)
+            if crawled_ids is not None:
+                crawled_ids.append(crawled_id)
+            _merge_crawl(merged, data)
+
+            if hop >= depth:
+                return
+            index = self.spotify_manager.index
+            for a_id, count in data[0].items():
+                if a_id not in queued:
+                    queued.add(a_id)
+                    if index:
+                        count = max(count, index.song_count(a_id))
+                    heapq.heappush(frontier, (hop + 1, -count, next(order), a_id))
+
+        merge(root_id, 0, root_data)
+
+        while frontier and not self._budget_exhausted(crawled, used_calls[0]):
+            hop, _, _, a_id = heapq.heappop(frontier)
+            if self.debug:
+                print(f"Crawling {a_id} (hop {hop}), {len(crawled)} artists crawled, {len(frontier)} queued")
+            if progress:
+                progress(hop=hop, artists_crawled=len(crawled), artists_queued=len(frontier))
+            with on_requests(count_call):
+                data = self.spotify_manager.getArtistCollabs(a_id, progress=progress)
+            merge(a_id, hop, data)
+
+        return _merged_result(merged, artist_response)
+
+    def merge_stored(self, artist_ids):
+        """
+        Merges the stored crawls of the given artists as crawl does, without any request.
+        Given the crawled_ids of a crawl, it rebuilds the data of that crawl; artists missing from the store are skipped.
+
+        Returns:
+            tuple: The merged data, in the format of crawl, with the first artist as the root.
+        """
+        merged = {}, {}, {}, {}
+        artist_response = None
+        for a_id in artist_ids:
+            data = self.spotify_manager.store.load(a_id)
+            if data is None:
+                continue
+            _merge_crawl(merged, data)
+            if a_id == artist_ids[0]:
+                artist_response = data[3]
+        return _merged_result(merged, artist_response)
+
+
+def _merge_crawl(merged, data):
+    """
+    Merges the data of one artist, as returned by getArtistCollabs, into the dictionaries of a crawl.
+    """
+    total_artists, registered_songs, last_collab_artist, artists_info = merged
+    artist_total, artist_songs, artist_last_collab, _, artist_info = data
+    for a_id, count in artist_total.items():
+        total_artists[a_id] = max(total_artists.get(a_id, 0), count)
+    for song_id, song in artist_songs.items():
+        merged_song = registered_songs.setdefault(song_id, dict(song, collaborations=[]))
+        for collaboration in song["collaborations"]:
+            if collaboration not in merged_song["collaborations"]:
+                merged_song["collaborations"].append(collaboration)
+    for a_id, date in artist_last_collab.items():
+        # Dates are stored as YYYY-MM-DD, so the string comparison is chronological
+        last_collab_artist[a_id] = max(last_collab_artist.get(a_id, date), date)
+    artists_info.update({a_id: info for a_id, info in artist_info.items() if a_id not in artists_info})
+
+
+def _merged_result(merged, artist_response):
+    total_artists, registered_songs, last_collab_artist, artists_info = merged
+    if artist_response is not None:
+        # Other crawls record their last collaboration with the root artist, which is not a collaborator of itself
+        last_collab_artist.pop(artist_response["id"], None)
+    return total_artists, registered_songs, last_collab_artist, artist_response, artists_info
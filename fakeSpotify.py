@@ -0,0 +1,267 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from spotipy.exceptions import SpotifyException
+
+# ID of the main artist of the synthetic discographies
+ROOT_ARTIST_ID = "A" + "0" * 21
+
+
+def _artist_id(n):
+    return f"A{n:021d}"
+
+
+def _album_id(artist, index):
+    return f"B{artist:010d}{index:011d}"
+
+
+def _track_id(artist, album, index):
+    return f"T{artist:010d}{album:06d}{index:05d}"
+
+
+def _call_key(endpoint, args, kwargs):
+    return f"{endpoint} {json.dumps([args, kwargs], sort_keys=True)}"
+
+
+class FakeSpotify:
+    """
+    Offline stand-in for spotipy.Spotify, to run and benchmark the crawls without the Spotify API.
+
+    It serves synthetic discographies of any size: the main artist (ROOT_ARTIST_ID) has
+    `songs_per_collaborator` songs with each of its `collaborators`, some of them shared by two
+    collaborators, and every collaborator has a few albums with the main artist and its neighbours.
+    The albums of the main artist can also be released in several editions, with the same title, date and songs.
+    Responses recorded with FixtureRecorder are replayed instead when their request matches.
+
+    It can also wait a fixed latency before each response and reject requests with 429 errors.
+    """
+    def __init__(self, collaborators=100, songs_per_collaborator=2, tracks_per_album=10, collaborator_albums=2,
+                 editions=1, latency=0.0, rate_limit_probability=0.0, retry_after=1, fixtures=None, seed=0):
+        """
+        Parameters:
+            collaborators (int): Number of collaborators of the main artist.
+            songs_per_collaborator (int): Number of songs of the main artist with each collaborator.
+            tracks_per_album (int): Number of tracks of each album, at most 50.
+            collaborator_albums (int): Number of albums of each collaborator.
+            editions (int): Number of editions of each album of the main artist, e.g. regional re-releases.
+            latency (float): Seconds waited before each response.
+            rate_limit_probability (float): Probability of answering a request with a 429 error.
+            retry_after (int): Seconds sent in the Retry-After header of the 429 errors.
+            fixtures (str, optional): Path of a JSON file written by FixtureRecorder.
+            seed (int): Seed of the 429 errors.
+        """
+        self.collaborators = collaborators
+        self.songs_per_collaborator = songs_per_collaborator
+        self.tracks_per_album = tracks_per_album
+        self.collaborator_albums = collaborator_albums
+        self.editions = editions
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.fixtures = {}
+        if fixtures:
+            with open(fixtures) as fixtures_file:
+                self.fixtures = json.load(fixtures_file)
+        # Number of requests received by endpoint, 429 errors included
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _respond(self, endpoint, args, kwargs):
+        """
+        Answers a request: counts it, waits the latency, injects the 429 errors and
+        returns the recorded response if there is one or else the synthetic one.
+        """
+        if endpoint == "next" and not args[0]["next"]:
+            return None
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            rate_limited = self._random.random() < self.rate_limit_probability
+        if self.latency:
+            time.sleep(self.latency)
+        if rate_limited:
+            raise SpotifyException(429, -1, f"{endpoint}: API rate limit exceeded",
+                                   headers={"Retry-After": str(self.retry_after)})
+        key = _call_key(endpoint, [args[0]["next"]] if endpoint == "next" else list(args), kwargs)
+        if key in self.fixtures:
+            return self.fixtures[key]
+        return getattr(self, "_synthetic_" + endpoint)(*args, **kwargs)
+
+    # spotipy.Spotify methods used by SpotifyManager
+
+    def artist(self, *args, **kwargs):
+        return self._respond("artist", args, kwargs)
+
+    def artists(self, *args, **kwargs):
+        return self._respond("artists", args, kwargs)
+
+    def artist_albums(self, *args, **kwargs):
+        return self._respond("artist_albums", args, kwargs)
+
+    def album_tracks(self, *args, **kwargs):
+        return self._respond("album_tracks", args, kwargs)
+
+    def albums(self, *args, **kwargs):
+        return self._respond("albums", args, kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._respond("search", args, kwargs)
+
+    def next(self, *args, **kwargs):
+        return self._respond("next", args, kwargs)
+
+    # Synthetic data
+
+    def _artist_number(self, artist_id):
+        if len(artist_id) != 22 or artist_id[0] != "A" or not artist_id[1:].isdigit():
+            raise SpotifyException(404, -1, f"Unknown artist: {artist_id}")
+        n = int(artist_id[1:])
+        if n > self.collaborators:
+            raise SpotifyException(404, -1, f"Unknown artist: {artist_id}")
+        return n
+
+    def _album_count(self, artist):
+        if artist:
+            return self.collaborator_albums
+        return self._original_album_count() * self.editions
+
+    def _original_album_count(self):
+        return math.ceil(self.collaborators * self.songs_per_collaborator / self.tracks_per_album)
+
+    def _original(self, artist, index):
+        # Index of the album of which the album `index` is an edition, every edition has its own IDs
+        return index % self._original_album_count() if artist == 0 else index
+
+    def _track_artists(self, artist, album, index):
+        if artist == 0:
+            # The songs with each collaborator follow each other, so their last collaborations are spread over
+            # the albums, and one in five songs also features a second collaborator
+            song = album * self.tracks_per_album + index
+            collaborator = song // self.songs_per_collaborator + 1
+            artists = [0, collaborator]
+            if song % 5 == 0 and self.collaborators > 1:
+                artists.append((song * 7) % self.collaborators + 1)
+            return list(dict.fromkeys(artists))
+        # Collaborators alternate songs with the main artist and with their neighbours
+        neighbour = (artist + index) % self.collaborators + 1
+        return list(dict.fromkeys([artist, 0 if index % 2 == 0 else neighbour]))
+
+    def _artist(self, n):
+        return {"id": _artist_id(n), "name": f"Artist {n}", "type": "artist",
+                "genres": [f"genre {n % 7}"] if n % 3 else [],
+                "images": [{"url": f"https://fake.spotify/artist/{n}/640", "height": 640, "width": 640}],
+                "external_urls": {"spotify": f"https://open.spotify.com/artist/{_artist_id(n)}"}}
+
+    def _simple_album(self, artist, index):
+        album_id = _album_id(artist, index)
+        original = self._original(artist, index)
+        year = 2000 + (original + artist) % 24
+        return {"id": album_id, "uri": f"spotify:album:{album_id}", "name": f"Album {original} of artist {artist}",
+                "album_type": "album" if original % 3 else "single", "album_group": "album",
+                "release_date": f"{year}-{original % 12 + 1:02d}-{original % 28 + 1:02d}", "release_date_precision": "day",
+                "total_tracks": self._track_count(artist, original),
+                "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+                "images": [{"url": f"https://fake.spotify/album/{album_id}/{size}", "height": size, "width": size}
+                           for size in (640, 300, 64)],
+                "artists": [{"id": _artist_id(artist), "name": f"Artist {artist}"}]}
+
+    def _track_count(self, artist, index):
+        if artist:
+            return self.tracks_per_album
+        total_songs = self.collaborators * self.songs_per_collaborator
+        return min(self.tracks_per_album, total_songs - index * self.tracks_per_album)
+
+    def _tracks(self, artist, index):
+        tracks = []
+        original = self._original(artist, index)
+        for t in range(self._track_count(artist, original)):
+            track_id = _track_id(artist, index, t)
+            tracks.append({"id": track_id, "name": f"Song {t} of album {original} of artist {artist}", "track_number": t + 1,
+                           "preview_url": f"https://fake.spotify/preview/{track_id}",
+                           "artists": [{"id": _artist_id(a), "name": f"Artist {a}"}
+                                       for a in self._track_artists(artist, original, t)]})
+        return tracks
+
+    def _parse_album(self, album_id):
+        album_id = album_id.split(":")[-1]
+        return int(album_id[1:11]), int(album_id[11:])
+
+    def _page(self, kind, key, items, offset, limit):
+        next_url = f"fake://{kind}/{key}?offset={offset + limit}&limit={limit}" if offset + limit < len(items) else None
+        return {"items": items[offset:offset + limit], "offset": offset, "limit": limit, "total": len(items), "next": next_url}
+
+    # Synthetic responses, with the signatures of the spotipy.Spotify methods
+
+    def _synthetic_artist(self, artist_id):
+        return self._artist(self._artist_number(artist_id))
+
+    def _synthetic_artists(self, artists):
+        return {"artists": [self._artist(self._artist_number(a_id)) for a_id in artists]}
+
+    def _synthetic_artist_albums(self, artist_id, album_type=None, country=None, limit=20, offset=0):
+        artist = self._artist_number(artist_id)
+        albums = [self._simple_album(artist, index) for index in range(self._album_count(artist))]
+        return self._page("artist_albums", artist_id, albums, offset, limit)
+
+    def _synthetic_album_tracks(self, album_id, limit=50, offset=0, market=None):
+        artist, index = self._parse_album(album_id)
+        return self._page("album_tracks", album_id, self._tracks(artist, index), offset, limit)
+
+    def _synthetic_albums(self, albums, market=None):
+        response = []
+        for album_id in albums:
+            artist, index = self._parse_album(album_id)
+            album = self._simple_album(artist, index)
+            album["tracks"] = self._page("album_tracks", album["uri"], self._tracks(artist, index), 0, 50)
+            response.append(album)
+        return {"albums": response}
+
+    def _synthetic_search(self, q, limit=10, offset=0, type="track", market=None):
+        return {"artists": {"items": [self._artist(0)][:limit], "total": 1}}
+
+    def _synthetic_next(self, result):
+        path, query = result["next"][len("fake://"):].split("?")
+        kind, key = path.split("/", 1)
+        params = dict(param.split("=") for param in query.split("&"))
+        offset, limit = int(params["offset"]), int(params["limit"])
+        if kind == "artist_albums":
+            return self._synthetic_artist_albums(key, limit=limit, offset=offset)
+        return self._synthetic_album_tracks(key, limit=limit, offset=offset)
+
+
+class FixtureRecorder:
+    """
+    Wraps a spotipy.Spotify client and records its responses, to replay them later with FakeSpotify.
+
+    Usage:
+        recorder = FixtureRecorder(spotipy.Spotify(...))
+        SpotifyManager(client=recorder).getArtistCollabs(artist_id, force=True)
+        recorder.save("fixtures.json")
+    """
+    def __init__(self, client):
+        self.client = client
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, endpoint):
+        method = getattr(self.client, endpoint)
+
+        def record(*args, **kwargs):
+            response = method(*args, **kwargs)
+            key = _call_key(endpoint, [args[0]["next"]] if endpoint == "next" else list(args), kwargs)
+            with self._lock:
+                self.responses[key] = response
+            return response
+        return record
+
+    def save(self, path):
+        """
+        Writes the recorded responses to a JSON file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock, open(path, "w") as fixtures_file:
+            json.dump(self.responses, fixtures_file)
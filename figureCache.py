@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+FIGURE_CACHE_PATH = os.path.join(".", "data", "figures.sqlite3")
+
+# Size cap of the stored figures (compressed), the least recently used ones are evicted above it
+MAX_FIGURE_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def data_version(total_artists, registered_songs, last_collab_artist, artists_info):
+    """
+    Returns a content hash of the data a graph figure is generated from.
+    Only the fields that change the figure are hashed: the songs of each artist, the collaborations,
+    the last collaboration dates and the names and genres of the artists.
+    """
+    collaborations = {song_id: song["collaborations"] for song_id, song in registered_songs.items()}
+    names = {a_id: [info.get("name"), info.get("genres")] for a_id, info in artists_info.items()}
+    content = json.dumps([total_artists, collaborations, last_collab_artist, names], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class FigureCache:
+    """
+    Persists the serialized JSON of the generated graph figures.
+
+    Figures are keyed by the artist, the version of its data and the render options, so a key
+    always maps to the same figure and entries never need to be invalidated, only evicted.
+    """
+    def __init__(self, path=FIGURE_CACHE_PATH, max_bytes=MAX_FIGURE_CACHE_BYTES):
+        """
+        Parameters:
+            path (str): Path of the SQLite database. Defaults to "data/figures.sqlite3".
+            max_bytes (int): Maximum size of the stored figures. Defaults to MAX_FIGURE_CACHE_BYTES.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS figures (
+                                    key TEXT PRIMARY KEY,
+                                    figure BLOB NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    accessed REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS figures_accessed ON figures (accessed)")
+
+    def get(self, key):
+        """
+        Returns the JSON of a cached figure, or None if it is not cached.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT figure FROM figures WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE figures SET accessed = ? WHERE key = ?", (time.time(), key))
+        return zlib.decompress(row[0]).decode()
+
+    def set(self, key, figure_json):
+        """
+        Stores the JSON of a figure, evicting the least recently used figures if the cache exceeds its size cap.
+        """
+        blob = zlib.compress(figure_json.encode(), 1)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO figures VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+            # Other processes may share the database, so the size is read from it
+            size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM figures").fetchone()[0]
+            if size <= self.max_bytes:
+                return
+            evicted = []
+            for old_key, old_size in self._conn.execute("SELECT key, size FROM figures ORDER BY accessed"):
+                if size <= self.max_bytes * 0.9:
+                    break
+                evicted.append((old_key,))
+                size -= old_size
+            self._conn.executemany("DELETE FROM figures WHERE key = ?", evicted)
+
+    def clear(self):
+        """
+        Removes every stored figure.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM figures")
@@ -0,0 +1,191 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+import urllib3
+from spotipy.exceptions import SpotifyException
+
+from metrics import metrics
+
+# Priorities of the requests, the lowest value goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Statuses retried by the HTTP session itself. 429 is left to the governor, which shares the wait between callers.
+SESSION_RETRY_STATUSES = (500, 502, 503, 504)
+
+_priority = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background_requests():
+    """
+    Context manager marking the requests sent inside its block (and in the contexts copied from it) as background work,
+    which only gets a turn when no interactive request is waiting.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def build_session(pool_size=16, retries=3, backoff_factor=0.3):
+    """
+    Builds a keep-alive HTTP session for spotipy.Spotify(requests_session=...), with a connection pool
+    large enough for the concurrent requests and retries of the server errors only.
+    """
+    session = requests.Session()
+    # urllib3 would also retry on its own every response with a Retry-After header, 429s included,
+    # each thread sleeping separately. They are returned as they are so the governor sees them.
+    retry = urllib3.Retry(total=retries, status=retries, backoff_factor=backoff_factor, status_forcelist=SESSION_RETRY_STATUSES,
+                          allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']), respect_retry_after_header=False)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RequestGovernor:
+    """
+    Paces the requests to the Spotify API of every caller of the process.
+
+    Each request takes a token from a bucket refilled at `rate` tokens per second and a slot
+    among the concurrent requests. The number of slots adapts AIMD-style: it grows by one after
+    as many consecutive successes as slots, and is halved on each burst of 429s. A 429 also pauses every
+    caller for the seconds given in its Retry-After header before the request is retried.
+    Waiting requests are served by priority (interactive before background) and then in arrival order.
+    """
+    def __init__(self, rate=10.0, burst=10, concurrency=4, max_concurrency=16, max_retries=5, max_retry_after=120):
+        """
+        Parameters:
+            rate (float): Requests per second allowed on average.
+            burst (int): Maximum number of tokens in the bucket, i.e. requests that can be sent at once after an idle period.
+            concurrency (int): Initial number of concurrent requests.
+            max_concurrency (int): Maximum number of concurrent requests.
+            max_retries (int): Maximum number of retries of a request rejected with a 429.
+            max_retry_after (float): A 429 asking to wait longer than this is raised instead of retried.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.limit = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._active = 0
+        self._successes = 0
+        self._blocked_until = 0.0
+        self._waiting = []
+        self._order = itertools.count()
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls `function` once the governor allows it, retrying it after the wait asked by the 429 responses.
+
+        Returns:
+            The result of the function.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(_priority.get())
+            try:
+                result = function(*args, **kwargs)
+            except SpotifyException as e:
+                if not self._is_rate_limited(e):
+                    raise
+                retry_after = self._retry_after(e)
+                self._on_rate_limited(retry_after)
+                if attempt == self.max_retries or retry_after > self.max_retry_after:
+                    raise
+                metrics.inc("spotify_api_retries_total")
+                continue
+            finally:
+                self._release()
+            self._on_success()
+            return result
+
+    def _acquire(self, priority):
+        start = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._order))
+            heapq.heappush(self._waiting, entry)
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                timeout = None
+                if self._waiting[0] == entry and self._active < self.limit:
+                    if now < self._blocked_until:
+                        timeout = self._blocked_until - now
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        self._active += 1
+                        heapq.heappop(self._waiting)
+                        # The next request in line may be able to go too
+                        self._cond.notify_all()
+                        break
+                    else:
+                        timeout = (1 - self._tokens) / self.rate
+                self._cond.wait(timeout)
+        metrics.observe("governor_wait_seconds", time.monotonic() - start, priority="background" if priority else "interactive")
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+
+    def _on_rate_limited(self, retry_after):
+        with self._cond:
+            now = time.monotonic()
+            # The requests in flight when the limit was hit are rejected together, they only count as one backoff
+            if now >= self._blocked_until:
+                metrics.inc("governor_backoffs_total")
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            self._cond.notify_all()
+
+    def _is_rate_limited(self, error):
+        """
+        Returns True for the 429 responses of the API, which carry their response headers (and usually Retry-After).
+        spotipy also raises a 429 without headers and with code -1 when the session gives up retrying a server error,
+        that one is raised at once instead of being retried.
+        """
+        if error.http_status != 429:
+            return False
+        return bool(error.headers) or error.code != -1
+
+    def _retry_after(self, error):
+        try:
+            return max(0.0, float((error.headers or {}).get("Retry-After", 1)))
+        except (TypeError, ValueError):
+            return 1.0
+
+
+_shared_governor = None
+_shared_governor_lock = threading.Lock()
+
+
+def shared_governor():
+    """
+    Returns the governor shared by every SpotifyManager of the process, creating it on first use.
+    """
+    global _shared_governor
+    with _shared_governor_lock:
+        if _shared_governor is None:
+            _shared_governor = RequestGovernor()
+        return _shared_governor
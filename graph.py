@@ -1,17 +1,69 @@
 import plotly.graph_objects as go
 import networkx as nx
+import numpy as np
 from datetime import datetime as dt
+import heapq
+import math
 import os
+import shutil
+import subprocess
+import time
 from utilities import Utilities as utils
+from layoutCache import LayoutCache, graph_hash
+from figureCache import FigureCache, data_version
+from metrics import metrics
+
+LAYOUT_ENGINES = ["auto", "kamada_kawai", "spring", "radial", "sfdp"]
+
+# Node counts used by the automatic choice of the layout engine.
+# kamada_kawai needs the all-pairs shortest paths, so it is only used on small graphs.
+KAMADA_KAWAI_MAX_NODES = 150
+SPRING_MAX_NODES = 1000
+
+# Iterations of the spring layout when it starts from the positions of a previous render
+WARM_START_ITERATIONS = 15
+
+# Level of detail of the large graphs: above LOD_NODES nodes the graph is drawn with WebGL traces and
+# only the LOD_LABELS artists with the most songs are labelled
+LOD_NODES = 300
+LOD_LABELS = 50
+# Collaborators kept in a graph, the least important ones are pruned before the layout
+MAX_NODES = 1000
+PRUNE_ORDERS = ["collabs", "recent"]
+# Decimals of the node coordinates sent to the browser
+COORDINATE_DIGITS = 4
 
 class Graph:
-    def __init__(self, debug=False, log_scale=True):
+    def __init__(self, debug=False, log_scale=True, layout="auto", spring_iterations=50, layout_cache=True, figure_cache=True,
+                 lod_nodes=LOD_NODES, max_labels=LOD_LABELS, max_nodes=MAX_NODES, prune_by="collabs",
+                 coordinate_digits=COORDINATE_DIGITS):
         os.environ["PATH"] += os.pathsep + os.getenv('graphizRoute')
         self.log_scale = log_scale
         self.node_base_size = 300
         if self.log_scale:
             self.node_base_size = 40
         self.debug = debug
+        if layout not in LAYOUT_ENGINES:
+            raise ValueError(f"Unknown layout engine: {layout}. Available: {', '.join(LAYOUT_ENGINES)}")
+        self.layout = layout
+        self.spring_iterations = spring_iterations
+        # Positions of previous renders, a LayoutCache instance can be given to customize it
+        if layout_cache is True:
+            layout_cache = LayoutCache()
+        self.layout_cache = layout_cache or None
+        # Serialized figures of previous renders, a FigureCache instance can be given to customize it
+        if figure_cache is True:
+            figure_cache = FigureCache()
+        self.figure_cache = figure_cache or None
+        # Level of detail: graphs with more than lod_nodes nodes use WebGL traces and label max_labels nodes,
+        # graphs with more than max_nodes nodes (None for no limit) only keep the collaborators ranked first by prune_by
+        if prune_by not in PRUNE_ORDERS:
+            raise ValueError(f"Unknown prune order: {prune_by}. Available: {', '.join(PRUNE_ORDERS)}")
+        self.lod_nodes = lod_nodes
+        self.max_labels = max_labels
+        self.max_nodes = max_nodes
+        self.prune_by = prune_by
+        self.coordinate_digits = coordinate_digits
 
     def get_color_by_genre(self, artist_genres):
         if artist_genres:  
@@ -22,7 +74,8 @@ class Graph:
 
         return color
 
-    def generate_graph(self, total_artists, registered_songs, last_collab_artist, artists_info, level=0):
+    def generate_graph(self, total_artists, registered_songs, last_collab_artist, artists_info, level=0, layout=None, cache_key=None,
+                       root=None, progress=None):
         """
         Generates a graph based on the given data.
 
@@ -32,26 +85,36 @@ class Graph:
             last_collab_artist (dict): A dictionary containing the last collaboration date of each artist.
             artist_data (dict): A dictionary containing the data of the main artist.
             artist_profile_urls (list): A list containing the profile URLs of the artists.
-            level (int): The level of the graph generation.
+            level (int): The level of the graph generation. From level 1 on, the collaborators that share a song are
+                         linked with each other and only the direct collaborators are linked with the main artist.
+            layout (str, optional): The layout engine, one of LAYOUT_ENGINES. Defaults to the engine of the instance.
+            cache_key (str, optional): The ID of the artist the graph belongs to. When given, the layout is
+                                       stored and reused on the next renders of the same graph.
+            root (str, optional): The ID of the main artist. Defaults to the artist with the most songs.
+            progress (callable, optional): Called with the current stage (stage="layout" or "traces").
 
         Returns:
             fig (go.Figure): The generated graph figure.
         """
+        build_start = time.perf_counter()
         if not total_artists:  # Si el diccionario está vacío
             raise ValueError("No artists found. Ensure your data source contains valid data.")
-        max_value = max(total_artists, key=total_artists.get)
+        max_value = root or max(total_artists, key=total_artists.get)
         artists_copy = total_artists.copy()  # Copy the original dictionary
         del artists_copy[max_value]  # Remove the main artist
         second_max_value = max(artists_copy, key=artists_copy.get)
         
-        for key, elem in last_collab_artist.items():
-            last_collab_artist[key] = dt.strptime(elem,'%Y-%m-%d')
+        # The data may be shared with other renders, so the dates are parsed into a new dict
+        last_collab_dates = {key: dt.strptime(elem,'%Y-%m-%d') for key, elem in last_collab_artist.items()}
 
-        minval = min(last_collab_artist)
+        # Large graphs only keep their most important collaborators
+        total_artists = self._prune(total_artists, last_collab_dates, max_value)
+
+        minval = min(last_collab_dates)
 
         deltas_datetime = {}
-        for key, val in last_collab_artist.items():
-            delta = last_collab_artist[minval] - val
+        for key, val in last_collab_dates.items():
+            delta = last_collab_dates[minval] - val
             deltas_datetime[key] = delta.days + 1
 
         deltas_to_regularize = deltas_datetime.values()
@@ -67,9 +130,13 @@ class Graph:
 
         G = nx.Graph(scale=1)
         G.add_node(max_value)
-        node_sizes.append(total_artists[second_max_value])
+        node_sizes.append(artists_copy[second_max_value])
         colors.append(self.get_color_by_genre(artists_info[max_value]['genres']))
 
+        # Artists sharing a song with the main artist, the only ones linked to it from level 1 on
+        direct_collaborators = {artist for song in registered_songs.values() for collaboration in song["collaborations"]
+                                if max_value in collaboration for artist in collaboration}
+
         for artist, songs in total_artists.items():
             artist_genres = artists_info[artist]['genres']
             color = self.get_color_by_genre(artist_genres)
@@ -80,15 +147,15 @@ class Graph:
             G.add_node(artist)
             if self.debug:
                 print(artist, songs, deltas_datetime[artist])
-            G.add_edge(max_value, artist, color='black', weight=deltas_datetime[artist])
+            if level == 0 or artist in direct_collaborators:
+                G.add_edge(max_value, artist, color='black', weight=deltas_datetime[artist])
             node_sizes.append(songs)
             colors.append(color)
 
         if level >= 1:
-            for song, artists in registered_songs.items():
-                for artist_list in artists:
-                    reduced_list = artist_list
-                    reduced_list.remove(max_value)
+            for song in registered_songs.values():
+                for collaboration in song["collaborations"]:
+                    reduced_list = [artist for artist in collaboration if artist != max_value and artist in G]
                     for i in range(0, len(reduced_list)):
                         for x in range(i+1, len(reduced_list)):
                             if not G.has_edge(reduced_list[i], reduced_list[x]):
@@ -102,42 +169,307 @@ class Graph:
         
 
 
-        pos = nx.kamada_kawai_layout(G)
+        metrics.observe("stage_seconds", time.perf_counter() - build_start, stage="graph_build")
+        if progress:
+            progress(stage="layout")
+        engine = layout or self.layout
+        if engine == "auto":
+            engine = self.choose_layout(G, max_value)
+        with metrics.timer("stage_seconds", stage="layout", engine=engine):
+            if cache_key and self.layout_cache:
+                pos = self._cached_layout(G, max_value, engine, cache_key, f"level={level};layout={engine}")
+            else:
+                pos = self.compute_layout(G, max_value, engine)
         
-        node_labels = {node: artists_info[node]['name'] for node in G.nodes()}
+        if progress:
+            progress(stage="traces")
+        with metrics.timer("stage_seconds", stage="traces"):
+            edge_trace, node_trace, label_trace = self._build_traces(G, pos, node_sizes, colors, total_artists,
+                                                                    last_collab_dates, artists_info, max_value)
+
+        layout = go.Layout(
+            showlegend=False,
+            dragmode="pan",
+            hovermode='closest',
+            margin=dict(b=0, l=0, r=0, t=0),
+            annotations=[],
+            xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+            yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
+
+        fig = go.Figure(data=[edge_trace, node_trace, label_trace], layout=layout)
+        return fig
+
+    def generate_graph_json(self, total_artists, registered_songs, last_collab_artist, artists_info, level=0, layout=None,
+                            cache_key=None, root=None, progress=None):
+        """
+        Generates a graph like generate_graph and returns it serialized as JSON.
+
+        The figures are stored in the figure cache under the artist, a hash of the data and the render
+        options, so rendering the same data again returns the stored JSON without building the figure.
+
+        Returns:
+            str: The JSON of the generated graph figure.
+        """
+        if self.figure_cache is None:
+            return self._serialize(self.generate_graph(total_artists, registered_songs, last_collab_artist, artists_info,
+                                                       level, layout, cache_key, root, progress))
+
+        key = "|".join([str(cache_key or root), data_version(total_artists, registered_songs, last_collab_artist, artists_info),
+                        f"root={root}", f"level={level}", f"layout={layout or self.layout}", f"log_scale={self.log_scale}",
+                        f"spring_iterations={self.spring_iterations}", f"lod={self.lod_nodes},{self.max_labels}",
+                        f"max_nodes={self.max_nodes},{self.prune_by}", f"digits={self.coordinate_digits}"])
+        figure_json = self.figure_cache.get(key)
+        metrics.inc("cache_requests_total", cache="figures", endpoint="figure", result="miss" if figure_json is None else "hit")
+        if figure_json is None:
+            figure_json = self._serialize(self.generate_graph(total_artists, registered_songs, last_collab_artist,
+                                                              artists_info, level, layout, cache_key, root, progress))
+            self.figure_cache.set(key, figure_json)
+        elif self.debug:
+            print(f"Figure of {cache_key or root} served from the figure cache")
+        return figure_json
 
-        edge_trace = go.Scatter(
-            x=[],
-            y=[],
-            line=dict(width=1, color='black'),
+    def _serialize(self, fig):
+        """
+        Serializes a figure to JSON, recording the time spent and the size of the result.
+        """
+        with metrics.timer("stage_seconds", stage="figure_serialize"):
+            figure_json = fig.to_json()
+        metrics.observe("figure_bytes", len(figure_json))
+        return figure_json
+
+    def _prune(self, total_artists, last_collab_dates, root):
+        """
+        Keeps the main artist and its max_nodes - 1 most important collaborators, ranked by number of songs
+        or by date of the last collaboration (prune_by), the other one breaking the ties.
+
+        Returns:
+            dict: The songs of the kept artists, in the original order. The same dict when nothing is pruned.
+        """
+        if not self.max_nodes or len(total_artists) <= self.max_nodes:
+            return total_artists
+        if self.prune_by == "recent":
+            def rank(artist):
+                return last_collab_dates.get(artist, dt.min), total_artists[artist]
+        else:
+            def rank(artist):
+                return total_artists[artist], last_collab_dates.get(artist, dt.min)
+        kept = set(heapq.nlargest(self.max_nodes - 1, (artist for artist in total_artists if artist != root), key=rank))
+        kept.add(root)
+        metrics.inc("graph_nodes_pruned_total", len(total_artists) - len(kept))
+        return {artist: songs for artist, songs in total_artists.items() if artist in kept}
+
+    def choose_layout(self, G, root):
+        """
+        Picks a layout engine from the size and shape of the graph.
+
+        Parameters:
+            G (nx.Graph): The collaboration graph.
+            root (str): The ID of the main artist.
+
+        Returns:
+            str: The name of the layout engine.
+        """
+        nodes, edges = G.number_of_nodes(), G.number_of_edges()
+        if nodes <= KAMADA_KAWAI_MAX_NODES:
+            return "kamada_kawai"
+        # Ego graphs (every edge goes to the main artist) have a closed-form layout
+        if edges == nodes - 1 and G.degree(root) == edges:
+            return "radial"
+        if nodes <= SPRING_MAX_NODES or not shutil.which("sfdp"):
+            return "spring"
+        return "sfdp"
+
+    def compute_layout(self, G, root, engine="auto", initial_pos=None):
+        """
+        Computes the position of every node.
+
+        Parameters:
+            G (nx.Graph): The collaboration graph.
+            root (str): The ID of the main artist.
+            engine (str): One of LAYOUT_ENGINES, "auto" picks it from the graph size.
+            initial_pos (dict, optional): Positions to start the iterative engines (kamada_kawai, spring) from,
+                                          which then converge in fewer iterations and keep the nodes in place.
+
+        Returns:
+            dict: The (x, y) position of each node.
+        """
+        if engine == "auto":
+            engine = self.choose_layout(G, root)
+        if self.debug:
+            print(f"Layout engine: {engine} ({G.number_of_nodes()} nodes, {G.number_of_edges()} edges)")
+
+        if initial_pos:
+            initial_pos = self._complete_positions(G, root, initial_pos)
+
+        if engine == "kamada_kawai":
+            return nx.kamada_kawai_layout(G, pos=initial_pos)
+        if engine == "radial":
+            return self._radial_layout(G, root)
+        if engine == "sfdp":
+            pos = self._sfdp_layout(G)
+            if pos is not None:
+                return pos
+        if initial_pos:
+            return nx.spring_layout(G, pos=initial_pos, iterations=WARM_START_ITERATIONS, seed=0)
+        return nx.spring_layout(G, iterations=self.spring_iterations, seed=0)
+
+    def _cached_layout(self, G, root, engine, artist_id, variant):
+        """
+        Returns the stored layout of the graph if it has not changed, otherwise computes it
+        starting from the stored positions and stores the result.
+        """
+        current_hash = graph_hash(G)
+        stored_hash, stored_pos = self.layout_cache.get(artist_id, variant)
+        if stored_hash == current_hash and set(stored_pos) == set(map(str, G.nodes())):
+            metrics.inc("cache_requests_total", cache="layouts", endpoint=engine, result="hit")
+            if self.debug:
+                print(f"Layout cache hit for {artist_id} ({variant})")
+            return {node: np.array(stored_pos[str(node)]) for node in G.nodes()}
+        metrics.inc("cache_requests_total", cache="layouts", endpoint=engine, result="miss")
+
+        pos = self.compute_layout(G, root, engine, initial_pos=stored_pos)
+        self.layout_cache.set(artist_id, variant, current_hash, pos)
+        return pos
+
+    def _complete_positions(self, G, root, initial_pos):
+        """
+        Extends the positions of a previous layout to the nodes added since then,
+        placing each new node next to its already placed neighbours.
+        """
+        rng = np.random.default_rng(0)
+        pos = {node: np.array(initial_pos[node], dtype=float) for node in G.nodes() if node in initial_pos}
+        center = pos.get(root, np.zeros(2))
+        for node in G.nodes():
+            if node in pos:
+                continue
+            placed = [pos[neighbor] for neighbor in G.neighbors(node) if neighbor in pos]
+            anchor = np.mean(placed, axis=0) if placed else center
+            pos[node] = anchor + rng.normal(scale=0.05, size=2)
+        return pos
+
+    def _radial_layout(self, G, root):
+        """
+        Places the main artist in the center and its collaborators around it, evenly spread,
+        at a distance given by the edge weight (how long ago the last collaboration was).
+        Nodes that are not connected to the main artist go to the outer ring.
+        """
+        others = [node for node in G.nodes() if node != root]
+        distances = [G.edges[root, node].get('weight', 1) if G.has_edge(root, node) else None for node in others]
+        max_distance = max([d for d in distances if d is not None], default=1)
+        pos = {root: np.zeros(2)}
+        for i, (node, distance) in enumerate(zip(others, distances)):
+            radius = (distance if distance is not None else max_distance * 1.2) / max_distance
+            angle = 2 * math.pi * i / len(others)
+            pos[node] = np.array([radius * math.cos(angle), radius * math.sin(angle)])
+        return pos
+
+    def _sfdp_layout(self, G):
+        """
+        Runs the Graphviz sfdp engine on the graph.
+
+        Returns:
+            dict: The position of each node, or None if Graphviz is not available or fails.
+        """
+        if not shutil.which("sfdp"):
+            return None
+        nodes = list(G.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        lines = ["graph G {", "overlap=prism;"]
+        lines += [f"{i};" for i in range(len(nodes))]
+        lines += [f"{index[a]} -- {index[b]};" for a, b in G.edges()]
+        lines.append("}")
+        try:
+            result = subprocess.run(["sfdp", "-Tplain"], input="\n".join(lines), capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            if self.debug:
+                print("sfdp failed: " + str(e))
+            return None
+
+        pos = {}
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            # node <name> <x> <y> <width> <height> ...
+            if fields and fields[0] == "node":
+                pos[nodes[int(fields[1])]] = np.array([float(fields[2]), float(fields[3])])
+        if len(pos) != len(nodes):
+            return None
+        return nx.rescale_layout_dict(pos)
+
+    def _build_traces(self, G, pos, node_sizes, colors, total_artists, last_collab_artist, artists_info, root):
+        """
+        Builds the edge, node and label traces of the graph.
+
+        Every coordinate, text and customdata array is assembled in a single pass and
+        each trace is created once, instead of appending to the traces point by point.
+        Graphs with more than lod_nodes nodes are drawn with WebGL (Scattergl) edge and node traces
+        and only the max_labels artists with the most songs are labelled.
+
+        Parameters:
+            G (nx.Graph): The collaboration graph.
+            pos (dict): The position of each node.
+            node_sizes (list): The marker size of each node, in node order.
+            colors (list): The marker color of each node, in node order.
+            total_artists (dict): The number of songs of each artist.
+            last_collab_artist (dict): The last collaboration date of each artist, as datetimes.
+            artists_info (dict): The information of each artist.
+            root (str): The ID of the main artist.
+
+        Returns:
+            tuple: The edge, node and label traces.
+        """
+        nodes = list(G.nodes())
+        index = {node: i for i, node in enumerate(nodes)}
+        coords = np.array([pos[node] for node in nodes], dtype=float).reshape(-1, 2)
+        if self.coordinate_digits is not None:
+            coords = coords.round(self.coordinate_digits)
+        large = len(nodes) > self.lod_nodes
+        scatter = go.Scattergl if large else go.Scatter
+
+        # Each edge is drawn as (start, end, gap), the NaN gap is serialized as null and breaks the line
+        edges = np.array([(index[a], index[b]) for a, b in G.edges()], dtype=int).reshape(-1, 2)
+        edge_x = np.full((len(edges), 3), np.nan)
+        edge_y = np.full((len(edges), 3), np.nan)
+        edge_x[:, 0], edge_x[:, 1] = coords[edges[:, 0], 0], coords[edges[:, 1], 0]
+        edge_y[:, 0], edge_y[:, 1] = coords[edges[:, 0], 1], coords[edges[:, 1], 1]
+
+        edge_trace = scatter(
+            x=edge_x.ravel(),
+            y=edge_y.ravel(),
+            line=dict(width=0.5, color='rgba(0, 0, 0, 0.4)') if large else dict(width=1, color='black'),
             hoverinfo='none',
             mode='lines')
 
-        for edge in G.edges():
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_trace['x'] += (x0, x1, None)
-            edge_trace['y'] += (y0, y1, None)
+        names = [artists_info[node]['name'] for node in nodes]
+        node_texts = []
+        for node, artist_name in zip(nodes, names):
+            if node == root:
+                node_texts.append("{}\nCollabs: {}".format(artist_name, total_artists[node]))
+            else:
+                last_collab_date = last_collab_artist[node].strftime('%d-%m-%Y')
+                node_texts.append("{}\nCollabs: {}\nLast: {}".format(artist_name, total_artists[node], last_collab_date))
 
-        node_trace = go.Scatter(
-            x=[],
-            y=[],
-            text=[],
+        node_trace = scatter(
+            x=coords[:, 0],
+            y=coords[:, 1],
+            text=node_texts,
             mode='markers',
-            customdata=[],
+            customdata=nodes,
             hoverinfo='text',
             marker=dict(
                 showscale=False,   
                 colorscale='YlGnBu',
+                color=colors,
                 size=node_sizes,
                 line_width=2))
 
-        node_trace.marker.color = colors
-
+        labelled = np.arange(len(nodes))
+        if large:
+            top = set(heapq.nlargest(self.max_labels, nodes, key=total_artists.get)) | {root}
+            labelled = np.array([i for i, node in enumerate(nodes) if node in top], dtype=int)
         label_trace = go.Scatter(
-            x=[],
-            y=[],
-            text=[],
+            x=coords[labelled, 0],
+            y=coords[labelled, 1],
+            text=[names[i] for i in labelled],
             mode='text',
             hoverinfo='none',
             textfont=dict(
@@ -147,35 +479,4 @@ class Graph:
             )
         )
 
-        for node in G.nodes():
-            x, y = pos[node]
-
-            node_trace['x'] += (x,)
-            node_trace['y'] += (y,)
-
-            artist_name = artists_info[node]['name']  # Usamos 'artists_info' para obtener el nombre del artista a partir de su ID.
-            
-            if node == max_value:
-                node_label = "{}\nCollabs: {}".format(artist_name, total_artists[node])
-            else:
-                last_collab_date = last_collab_artist[node].strftime('%d-%m-%Y')
-                node_label = "{}\nCollabs: {}\nLast: {}".format(artist_name, total_artists[node], last_collab_date)
-
-            node_trace['text'] += (node_label,)
-            node_trace['customdata'] += (node,)
-
-            label_trace['x'] += (x,)
-            label_trace['y'] += (y,)
-            label_trace['text'] += (node_labels[node],) 
-
-        layout = go.Layout(
-            showlegend=False,
-            dragmode="pan",
-            hovermode='closest',
-            margin=dict(b=0, l=0, r=0, t=0),
-            annotations=[],
-            xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-            yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
-
-        fig = go.Figure(data=[edge_trace, node_trace, label_trace], layout=layout)
-        return fig
+        return edge_trace, node_trace, label_trace
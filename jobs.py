@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics, profiled
+
+JOBS_PATH = os.path.join(".", "data", "jobs.sqlite3")
+
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION = 60 * 60
+
+# Minimum seconds between two writes of the progress of a job
+PROGRESS_INTERVAL = 0.25
+
+# The queued and running jobs of a queue get a heartbeat every HEARTBEAT_INTERVAL seconds. Jobs whose last
+# heartbeat is older than JOB_STALE_AFTER belonged to a process that died, they count as failed.
+HEARTBEAT_INTERVAL = 5
+JOB_STALE_AFTER = 30
+
+
+class Job:
+    """
+    Handle given to the function of a job to report its progress.
+    """
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.progress = {}
+        self._last_write = 0
+
+    def update(self, force=False, **progress):
+        """
+        Merges the given fields into the progress of the job. The writes are throttled
+        to one every PROGRESS_INTERVAL seconds unless `force` is True.
+        """
+        self.progress.update(progress)
+        now = time.time()
+        if force or now - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = now
+            self.queue._write(self.id, progress=self.progress)
+
+
+class JobQueue:
+    """
+    Runs long tasks on a pool of threads and keeps their state in a SQLite database.
+
+    The state, progress and result of every job can be read from any thread or worker
+    process, so a request only submits the job and the client polls its status.
+    While the queue runs a job it keeps refreshing its `updated` time, so the jobs left
+    unfinished by a crash or a restart are detected and do not block their key.
+    """
+    def __init__(self, path=JOBS_PATH, workers=4):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                    id TEXT PRIMARY KEY,
+                                    key TEXT,
+                                    state TEXT NOT NULL,
+                                    progress TEXT NOT NULL,
+                                    result TEXT,
+                                    error TEXT,
+                                    updated REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, state)")
+        # Jobs of this queue that are queued or running, their heartbeat is written by a background thread
+        self._live = set()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def submit(self, key, function, *args):
+        """
+        Runs `function(job, *args)` in the background.
+
+        Parameters:
+            key (str): Identifies the work done by the job. While a job with the same key is
+                       queued or running, its ID is returned instead of starting another one.
+            function (callable): Receives the Job handle and the arguments, returns a JSON serializable result.
+
+        Returns:
+            str: The ID of the job.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE state IN ('done', 'failed') AND updated < ?",
+                               (time.time() - JOB_RETENTION,))
+            self._conn.execute("UPDATE jobs SET state = 'failed', error = 'Job abandoned' "
+                               "WHERE state IN ('queued', 'running') AND updated < ?", (time.time() - JOB_STALE_AFTER,))
+            row = self._conn.execute("SELECT id FROM jobs WHERE key = ? AND state IN ('queued', 'running')",
+                                     (key,)).fetchone()
+            if row:
+                return row[0]
+            job_id = uuid.uuid4().hex
+            self._conn.execute("INSERT INTO jobs VALUES (?, ?, 'queued', '{}', NULL, NULL, ?)", (job_id, key, time.time()))
+            self._live.add(job_id)
+        self._executor.submit(self._run, Job(self, job_id), function, args)
+        return job_id
+
+    def status(self, job_id):
+        """
+        Returns the state of a job.
+
+        Returns:
+            dict: state ("queued", "running", "done" or "failed"), progress, result and error,
+                  or None if the job does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT state, progress, result, error, updated FROM jobs WHERE id = ?",
+                                     (job_id,)).fetchone()
+        if row is None:
+            return None
+        state, progress, result, error, updated = row
+        if state in ("queued", "running") and updated < time.time() - JOB_STALE_AFTER:
+            state, error = "failed", "Job abandoned"
+        return {"state": state, "progress": json.loads(progress),
+                "result": json.loads(result) if result is not None else None, "error": error}
+
+    def _run(self, job, function, args):
+        self._write(job.id, state="running")
+        try:
+            with metrics.timer("job_seconds", function=function.__name__), profiled(f"job-{function.__name__}"):
+                result = function(job, *args)
+        except Exception as e:
+            metrics.inc("jobs_failed_total", function=function.__name__)
+            traceback.print_exc()
+            self._finish(job.id, state="failed", error=str(e) or type(e).__name__, progress=job.progress)
+            return
+        self._finish(job.id, state="done", result=result, progress=job.progress)
+
+    def _finish(self, job_id, **fields):
+        self._write(job_id, **fields)
+        with self._lock:
+            self._live.discard(job_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock, self._conn:
+                self._conn.executemany("UPDATE jobs SET updated = ? WHERE id = ? AND state IN ('queued', 'running')",
+                                       [(time.time(), job_id) for job_id in self._live])
+
+    def _write(self, job_id, state=None, progress=None, result=None, error=None):
+        fields, values = ["updated = ?"], [time.time()]
+        if state is not None:
+            fields.append("state = ?")
+            values.append(state)
+        if progress is not None:
+            fields.append("progress = ?")
+            values.append(json.dumps(progress))
+        if result is not None:
+            fields.append("result = ?")
+            values.append(json.dumps(result))
+        if error is not None:
+            fields.append("error = ?")
+            values.append(error)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {', '.join(fields)} WHERE id = ?", values + [job_id])
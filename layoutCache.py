@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LAYOUT_CACHE_PATH = os.path.join(".", "data", "layouts.sqlite3")
+
+
+def graph_hash(G):
+    """
+    Returns a content hash of the nodes, edges and edge weights of a graph.
+    """
+    nodes = sorted(str(node) for node in G.nodes())
+    edges = sorted(sorted((str(a), str(b))) + [round(float(data.get('weight', 1)), 6)] for a, b, data in G.edges(data=True))
+    return hashlib.sha1(json.dumps([nodes, edges]).encode()).hexdigest()
+
+
+class LayoutCache:
+    """
+    Persists the node positions computed for each artist and graph variant.
+
+    Only the latest layout of every (artist, variant) pair is kept, together with the hash
+    of the graph it was computed for. It is reused as is while the graph does not change,
+    and as the starting point of the layout after the graph changes.
+    """
+    def __init__(self, path=LAYOUT_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS layouts (
+                                    artist_id TEXT NOT NULL,
+                                    variant TEXT NOT NULL,
+                                    graph_hash TEXT NOT NULL,
+                                    positions TEXT NOT NULL,
+                                    updated REAL NOT NULL,
+                                    PRIMARY KEY (artist_id, variant))""")
+
+    def get(self, artist_id, variant):
+        """
+        Returns the latest layout of an artist graph variant.
+
+        Returns:
+            tuple: The graph hash and the positions (dict of node to [x, y]), or (None, None).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT graph_hash, positions FROM layouts WHERE artist_id = ? AND variant = ?",
+                                     (artist_id, variant)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def set(self, artist_id, variant, graph_hash, pos):
+        """
+        Stores the layout of an artist graph variant, replacing the previous one.
+        """
+        positions = json.dumps({node: [float(x), float(y)] for node, (x, y) in pos.items()})
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO layouts VALUES (?, ?, ?, ?, ?)",
+                               (artist_id, variant, graph_hash, positions, time.time()))
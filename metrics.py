@@ -0,0 +1,153 @@
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Folder where the profiles are dumped, profiling is disabled when it is not set
+PROFILE_DIR_ENV = "profileDir"
+
+
+class Metrics:
+    """
+    In-process registry of counters and timers, rendered in the Prometheus text format.
+
+    Counters only go up. Timers (and any other observed value, such as figure sizes) keep
+    the number of observations, their sum and their maximum. Every series is identified by
+    its name and labels, e.g. inc("spotify_api_calls_total", endpoint="albums").
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        """
+        Sets the help text of a metric.
+        """
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Increments a counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """
+        Records an observation of a summary, e.g. a duration in seconds or a size in bytes.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total, maximum = self._summaries.get(key, (0, 0.0, value))
+            self._summaries[key] = (count + 1, total + value, max(maximum, value))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Context manager observing the seconds spent in its block, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def value(self, name, **labels):
+        """
+        Returns the value of a counter, 0 if it was never incremented.
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = dict(self._summaries)
+
+        lines = []
+        for name in sorted({key[0] for key in counters}):
+            lines += self._header(name, "counter")
+            lines += [f"{name}{_labels(labels)} {value}" for (n, labels), value in sorted(counters.items()) if n == name]
+        for name in sorted({key[0] for key in summaries}):
+            series = [(labels, value) for (n, labels), value in sorted(summaries.items()) if n == name]
+            lines += self._header(name, "summary")
+            for labels, (count, total, _) in series:
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            # Summaries only have a count and a sum, the maximum goes in its own gauge
+            lines.append(f"# TYPE {name}_max gauge")
+            lines += [f"{name}_max{_labels(labels)} {maximum:.6f}" for labels, (_, _, maximum) in series]
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name, kind):
+        header = [f"# HELP {name} {self._help[name]}"] if name in self._help else []
+        return header + [f"# TYPE {name} {kind}"]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+# Held by the block being profiled. Since Python 3.12 only one profiler can be active per process.
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(name):
+    """
+    Context manager that profiles its block with cProfile when the profileDir environment variable is set,
+    and dumps the stats to "<profileDir>/<timestamp>-<name>.prof" (readable with pstats or snakeviz).
+    One block is profiled at a time, the blocks started meanwhile in other threads run without profiling.
+    """
+    folder = os.getenv(PROFILE_DIR_ENV)
+    if not folder or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool is active, e.g. a debugger
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                os.makedirs(folder, exist_ok=True)
+                safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "root"
+                profile.dump_stats(os.path.join(folder, f"{time.time():.6f}-{safe_name}.prof"))
+    finally:
+        _profile_lock.release()
+
+
+# Registry shared by every module of the application
+metrics = Metrics()
+metrics.describe("spotify_api_calls_total", "Requests sent to the Spotify API by endpoint.")
+metrics.describe("spotify_api_errors_total", "Spotify API requests that failed, by endpoint and HTTP status.")
+metrics.describe("spotify_api_rate_limited_total", "Spotify API requests rejected with a 429 status, by endpoint.")
+metrics.describe("spotify_api_retries_total", "Spotify API requests retried by the governor after a 429 status.")
+metrics.describe("governor_backoffs_total", "Times the governor halved its concurrency and paused the requests after a 429 status.")
+metrics.describe("governor_wait_seconds", "Time the Spotify API requests waited for the governor, by priority.")
+metrics.describe("spotify_api_seconds", "Duration of the Spotify API requests by endpoint.")
+metrics.describe("cache_requests_total", "Lookups of the caches and stores by result (hit or miss).")
+metrics.describe("albums_deduplicated_total", "Album editions skipped because an edition with the same title, date and tracks was fetched.")
+metrics.describe("crawls_coalesced_total", "Artist crawls served by the concurrent crawl of the same artist they waited for.")
+metrics.describe("stage_seconds", "Duration of the stages of the crawls and the renders.")
+metrics.describe("graph_nodes_pruned_total", "Collaborators left out of the rendered graphs above their maximum number of nodes.")
+metrics.describe("figure_bytes", "Size of the serialized graph figures.")
+metrics.describe("http_request_seconds", "Duration of the HTTP requests served by the app, by route.")
+metrics.describe("job_seconds", "Duration of the background jobs by function.")
+metrics.describe("jobs_failed_total", "Background jobs that raised an exception, by function.")
@@ -0,0 +1,168 @@
+"""
+Crawls a list of artists in bulk to warm the artist store, and optionally the layout and figure caches,
+without starting the Dash application.
+
+Usage: python precompute.py artists.txt [--workers N] [--processes] [--rate R] [--hops H] [--render] [--checkpoint PATH]
+
+The file has one artist per line: an ID, a link or a name. Empty lines and lines starting with # are skipped.
+Each finished artist is appended to the checkpoint file, and a run started again with the same checkpoint
+skips them, so an interrupted run resumes where it stopped. Failed artists are retried by the next run.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from crawler import CollabCrawler
+from governor import RequestGovernor
+from spoManager import SpotifyManager
+
+DEFAULT_CHECKPOINT = os.path.join(".", "data", "precompute.checkpoint")
+
+# Objects of the worker process, created by _init_worker
+_worker = {}
+
+
+def read_artists(path):
+    """
+    Returns the artists listed in a file, in order and without duplicates.
+    """
+    with open(path, encoding="utf-8") as artists_file:
+        lines = (line.strip() for line in artists_file)
+        return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def read_checkpoint(path):
+    """
+    Returns the artists of the file that were already precomputed, a missing file means none.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as checkpoint:
+        for line in checkpoint:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Last line cut by an interruption
+                continue
+            if entry.get("ok"):
+                done.add(entry["artist"])
+    return done
+
+
+def _init_worker(rate, workers, hops, max_artists, render):
+    """
+    Creates the manager, crawler and graph used by the precompute calls of this process.
+    The requests of every thread of the process share one governor, limited to `rate` requests per second.
+    """
+    governor = RequestGovernor(rate=rate, burst=max(1, round(rate)))
+    _worker["manager"] = SpotifyManager(workers=workers, governor=governor)
+    _worker["crawler"] = CollabCrawler(_worker["manager"], max_artists=max_artists)
+    _worker["hops"] = hops
+    if render:
+        # Imported here so plain crawls do not need the graph dependencies
+        from graph import Graph
+        _worker["graph"] = Graph()
+
+
+def precompute_artist(artist):
+    """
+    Crawls an artist, and renders its graph as the app does when the process renders graphs.
+
+    Returns:
+        dict: The checkpoint entry of the artist: the line of the file, the ID found, whether it succeeded and the error.
+    """
+    manager, hops = _worker["manager"], _worker["hops"]
+    try:
+        if hops:
+            total_artists, registered_songs, last_collab, artist_data, artists_info = _worker["crawler"].crawl(artist, hops)
+        else:
+            total_artists, registered_songs, last_collab, artist_data, artists_info = manager.getArtistCollabs(artist)
+        if "graph" in _worker:
+            # Same arguments as app.generate_graph_job, so the app finds the layout and the figure in the caches
+            _worker["graph"].generate_graph_json(total_artists, registered_songs, last_collab, artists_info, hops,
+                                                 cache_key=artist_data["id"], root=artist_data["id"])
+    except Exception as e:
+        return {"artist": artist, "id": None, "ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {"artist": artist, "id": artist_data["id"], "ok": True, "error": None}
+
+
+def precompute(artists, checkpoint_path=DEFAULT_CHECKPOINT, workers=4, processes=False, rate=10.0, hops=0,
+               max_artists=30, render=False):
+    """
+    Precomputes the artists not in the checkpoint yet.
+
+    Parameters:
+        artists (list): IDs, links or names of the artists.
+        checkpoint_path (str): File where the finished artists are appended.
+        workers (int): Number of artists precomputed at the same time.
+        processes (bool): If True, each artist is precomputed in a pool of processes instead of threads.
+                          The album tracks of each artist are then fetched by the threads of its process.
+        rate (float): Spotify API requests per second allowed to the whole run, split between the processes.
+        hops (int): Hops of collaborators crawled for each artist, as in the app.
+        max_artists (int): Maximum number of artists crawled for each artist when hops is not 0.
+        render (bool): If True, the graph of each artist is rendered to fill the layout and figure caches.
+
+    Returns:
+        tuple: The number of artists precomputed and failed by this run.
+    """
+    done = read_checkpoint(checkpoint_path)
+    pending = [artist for artist in artists if artist not in done]
+    print(f"{len(pending)} artists to precompute, {len(artists) - len(pending)} already in the checkpoint")
+    if not pending:
+        return 0, 0
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(rate / workers, 4, hops, max_artists, render))
+    else:
+        _init_worker(rate, workers, hops, max_artists, render)
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+    succeeded = failed = 0
+    start = time.time()
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        try:
+            futures = [executor.submit(precompute_artist, artist) for artist in pending]
+            for future in as_completed(futures):
+                entry = future.result()
+                checkpoint.write(json.dumps(entry) + "\n")
+                checkpoint.flush()
+                if entry["ok"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                    print(f"Failed {entry['artist']}: {entry['error']}")
+                finished = succeeded + failed
+                if finished % 10 == 0 or finished == len(pending):
+                    print(f"{finished}/{len(pending)} artists, {failed} failed, {time.time() - start:.0f}s")
+        except KeyboardInterrupt:
+            print("Interrupted, the next run resumes from the checkpoint")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    executor.shutdown()
+    return succeeded, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("artists", help="File with one artist ID, link or name per line")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="File of the finished artists")
+    parser.add_argument("--workers", type=int, default=4, help="Artists precomputed at the same time")
+    parser.add_argument("--processes", action="store_true", help="Use a pool of processes instead of threads")
+    parser.add_argument("--rate", type=float, default=10.0, help="Spotify API requests per second of the whole run")
+    parser.add_argument("--hops", type=int, default=0, help="Hops of collaborators crawled for each artist")
+    parser.add_argument("--max-artists", type=int, default=30, help="Artists crawled for each artist when hops is not 0")
+    parser.add_argument("--render", action="store_true", help="Render the graphs to fill the layout and figure caches")
+    args = parser.parse_args()
+
+    try:
+        _, failed_count = precompute(read_artists(args.artists), args.checkpoint, max(1, args.workers), args.processes,
+                                     args.rate, args.hops, args.max_artists, args.render)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    sys.exit(1 if failed_count else 0)
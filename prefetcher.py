@@ -0,0 +1,134 @@
+import itertools
+import queue
+import threading
+from contextlib import contextmanager
+
+from governor import background_requests
+from spoManager import CrawlCancelled, on_requests
+
+
+class Prefetcher:
+    """
+    Crawls in the background the artists a user is likely to open next.
+
+    After a graph is served, its top collaborators are queued and crawled by a small pool of
+    worker threads. Background crawls yield to the users whose requests need the Spotify API:
+    while one is in progress the running prefetches are cancelled (and queued again) and no new one starts.
+    """
+    def __init__(self, spotify_manager, top_k=5, workers=1, max_queued=200, debug=False):
+        """
+        Parameters:
+            spotify_manager (SpotifyManager): The manager used to crawl the artists.
+            top_k (int): Number of collaborators queued after each graph.
+            workers (int): Maximum number of artists crawled at the same time in the background.
+            max_queued (int): Maximum number of artists waiting to be crawled, new ones are dropped above it.
+            debug (bool): If True, prints the progress of the prefetches.
+        """
+        self.spotify_manager = spotify_manager
+        self.top_k = top_k
+        self.max_queued = max_queued
+        self.debug = debug
+        # Entries are (-collaborations, order, artist_id), so the most frequent collaborators go first
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        # Number of user requests in progress, background work waits until it drops to 0
+        self._interactive = 0
+        self._idle = threading.Condition()
+        self._cancel = threading.Event()
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._work, name=f"prefetch-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def enqueue_collaborators(self, artist_id, total_artists):
+        """
+        Queues the top collaborators of an artist that have not been crawled yet.
+
+        Parameters:
+            artist_id (str): The ID of the artist whose graph was served.
+            total_artists (dict): The number of songs of each collaborator, as returned by getArtistCollabs.
+        """
+        collaborators = sorted((a_id for a_id in total_artists if a_id != artist_id),
+                               key=total_artists.get, reverse=True)[:self.top_k]
+        for a_id in collaborators:
+            self.enqueue(a_id, total_artists[a_id])
+
+    def enqueue(self, artist_id, priority=0):
+        """
+        Queues an artist for crawling. Artists already queued or stored are ignored.
+        """
+        with self._queued_lock:
+            if artist_id in self._queued or len(self._queued) >= self.max_queued:
+                return
+            if self.spotify_manager.store.exists(artist_id):
+                return
+            self._queued.add(artist_id)
+        self._queue.put((-priority, next(self._order), artist_id))
+
+    @contextmanager
+    def interactive(self):
+        """
+        Context manager wrapping a user request. From its first request to the Spotify API until the block ends,
+        background crawls are cancelled and paused. Requests served from the store do not interrupt them.
+        """
+        lock = threading.Lock()
+        # "active" once the first request is sent, "closed" when the block ends
+        state = {"active": False, "closed": False}
+
+        def on_request():
+            with lock:
+                if state["active"] or state["closed"]:
+                    return
+                state["active"] = True
+                with self._idle:
+                    self._interactive += 1
+                    self._cancel.set()
+
+        try:
+            with on_requests(on_request):
+                yield
+        finally:
+            with lock:
+                state["closed"] = True
+                if state["active"]:
+                    with self._idle:
+                        self._interactive -= 1
+                        if self._interactive == 0:
+                            self._cancel.clear()
+                            self._idle.notify_all()
+
+    def stop(self):
+        """
+        Stops the workers once their current crawl is cancelled.
+        """
+        self._stopped = True
+        self._cancel.set()
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._order), None))
+
+    def _work(self):
+        while True:
+            priority, _, artist_id = self._queue.get()
+            if self._stopped:
+                return
+            with self._idle:
+                self._idle.wait_for(lambda: self._interactive == 0 or self._stopped)
+            try:
+                if self.debug:
+                    print(f"Prefetching {artist_id}")
+                # Prefetch requests wait behind the ones of the users
+                with background_requests():
+                    self.spotify_manager.getArtistCollabs(artist_id, should_stop=self._cancel.is_set)
+            except CrawlCancelled:
+                if self.debug:
+                    print(f"Prefetch of {artist_id} cancelled")
+                if not self._stopped:
+                    self._queue.put((priority, next(self._order), artist_id))
+                continue
+            except Exception as e:
+                if self.debug:
+                    print(f"Prefetch of {artist_id} failed: {e}")
+            with self._queued_lock:
+                self._queued.discard(artist_id)
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.path.join(".", "data", "responses.sqlite3")
+
+DAY = 24 * 60 * 60
+
+# Seconds a cached response of each endpoint is considered fresh.
+# Album track listings are practically immutable, artist metadata (images, genres) changes more often.
+ENDPOINT_TTLS = {
+    "albums": 90 * DAY,
+    "album_tracks": 90 * DAY,
+    "artists": 7 * DAY,
+}
+DEFAULT_TTL = DAY
+
+# Size cap of the stored responses, the least recently used ones are evicted above it
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+    Persistent cache of Spotify API responses stored in a SQLite database.
+
+    Responses are keyed by endpoint and object ID (album ID, artist ID...), so any crawl
+    can reuse the objects already downloaded by another one.
+    """
+    def __init__(self, path=CACHE_PATH, ttls=None, max_bytes=MAX_CACHE_BYTES):
+        """
+        Parameters:
+            path (str): Path of the SQLite database. Defaults to "data/responses.sqlite3".
+            ttls (dict, optional): Seconds of freshness per endpoint, merged over ENDPOINT_TTLS.
+            max_bytes (int): Maximum size of the stored responses. Defaults to MAX_CACHE_BYTES.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttls = dict(ENDPOINT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                    endpoint TEXT NOT NULL,
+                                    key TEXT NOT NULL,
+                                    value TEXT NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    created REAL NOT NULL,
+                                    accessed REAL NOT NULL,
+                                    PRIMARY KEY (endpoint, key))""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def get(self, endpoint, key):
+        """
+        Returns the cached response for an object or None if it is missing or expired.
+        """
+        return self.get_many(endpoint, [key]).get(key)
+
+    def get_many(self, endpoint, keys):
+        """
+        Looks up several objects of the same endpoint.
+
+        Parameters:
+            endpoint (str): The endpoint the responses belong to, e.g. "albums".
+            keys (list): The object IDs.
+
+        Returns:
+            dict: The fresh cached responses, keyed by object ID. Missing IDs are not included.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        min_created = now - self.ttls.get(endpoint, DEFAULT_TTL)
+        found = {}
+        with self._lock, self._conn:
+            # SQLite limits the number of bound parameters, so the lookup is done in slices
+            for i in range(0, len(keys), 500):
+                keys_chunk = keys[i:i+500]
+                placeholders = ",".join("?" * len(keys_chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM responses WHERE endpoint = ? AND key IN ({placeholders})",
+                    [endpoint] + keys_chunk).fetchall()
+                for key, value, created in rows:
+                    if created >= min_created:
+                        found[key] = json.loads(value)
+            self._conn.executemany("UPDATE responses SET accessed = ? WHERE endpoint = ? AND key = ?",
+                                   [(now, endpoint, key) for key in found])
+        return found
+
+    def set(self, endpoint, key, value):
+        """
+        Stores the response for an object.
+        """
+        self.set_many(endpoint, {key: value})
+
+    def set_many(self, endpoint, values):
+        """
+        Stores several responses of the same endpoint.
+
+        Parameters:
+            endpoint (str): The endpoint the responses belong to.
+            values (dict): The responses keyed by object ID.
+        """
+        if not values:
+            return
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            serialized = json.dumps(value)
+            rows.append((endpoint, key, serialized, len(serialized), now, now))
+        with self._lock, self._conn:
+            keys = list(values)
+            replaced = 0
+            for i in range(0, len(keys), 500):
+                keys_chunk = keys[i:i+500]
+                placeholders = ",".join("?" * len(keys_chunk))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM responses WHERE endpoint = ? AND key IN ({placeholders})",
+                    [endpoint] + keys_chunk).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._size += sum(row[3] for row in rows) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Deletes the least recently used responses until the cache fits in its size cap.
+        Must be called holding the lock and inside a transaction.
+        """
+        # Other processes may share the database, so the real size is recomputed first
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = self.max_bytes * 0.9
+        cursor = self._conn.execute("SELECT endpoint, key, size FROM responses ORDER BY accessed")
+        evicted = []
+        for endpoint, key, size in cursor:
+            if self._size <= target:
+                break
+            evicted.append((endpoint, key))
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE endpoint = ? AND key = ?", evicted)
+
+    def clear(self):
+        """
+        Removes every stored response.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+            self._size = 0
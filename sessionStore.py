@@ -0,0 +1,106 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# Memory budget of the graph data kept by the server
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Maximum number of sessions remembered
+DEFAULT_MAX_SESSIONS = 1000
+
+
+def deep_size(obj, seen=None):
+    """
+    Returns an estimate of the memory used by an object and everything it contains.
+    Objects referenced more than once are only counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "to_plotly_json"):
+        # Dash components, such as the memoized detail panels
+        size += deep_size(obj.to_plotly_json(), seen)
+    return size
+
+
+class SessionStore:
+    """
+    Server side state of the users of the app.
+
+    The data of each graph is stored once, under a key such as (artist ID, hops, version), and shared by
+    every session showing that graph; the data must not be modified once stored. A session only
+    keeps the key of the graph it is showing. Both are evicted in least recently used order:
+    the graph data when the memory budget is exceeded and the sessions above `max_sessions`.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_sessions=DEFAULT_MAX_SESSIONS):
+        """
+        Parameters:
+            max_bytes (int): Memory budget of the stored graph data, as estimated by deep_size.
+            max_sessions (int): Maximum number of sessions remembered.
+        """
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.total_bytes = 0
+        self._data = OrderedDict()
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, data):
+        """
+        Stores the data of a graph, replacing any previous data with the same key.
+        Data larger than the whole budget is not stored.
+        """
+        size = deep_size(data)
+        with self._lock:
+            if key in self._data:
+                self.total_bytes -= self._data.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._data[key] = (data, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get(self, key):
+        """
+        Returns the data of a graph, or None if it is not stored.
+        """
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key][0]
+
+    def set_view(self, session_id, key):
+        """
+        Records the graph shown by a session.
+        """
+        with self._lock:
+            self._sessions[session_id] = key
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def view(self, session_id):
+        """
+        Returns the key of the graph shown by a session, or None if it is unknown.
+        """
+        with self._lock:
+            key = self._sessions.get(session_id)
+            if key is not None:
+                self._sessions.move_to_end(session_id)
+            return key
+
+    def get_session(self, session_id):
+        """
+        Returns the data of the graph shown by a session, or None if the session or its data are not stored.
+        """
+        key = self.view(session_id)
+        return self.get(key) if key is not None else None
@@ -1,45 +1,427 @@
+import contextvars
+import itertools
 import os
+import re
+import threading
+import time
 import spotipy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime as dt
 from spotipy.oauth2 import SpotifyOAuth
-from utilities import Utilities as utils
+from responseCache import ResponseCache
+from artistStore import ArtistStore
+from collabIndex import CollabIndex
+from crawlLock import CrawlLocks
+from metrics import metrics
+from governor import build_session, shared_governor
 from dotenv import load_dotenv
 
-ARTIST_PATH = os.path.join(".", "data", "{}")
 ARTIST_URL_PREFIX = "https://open.spotify.com/artist/"
 
 RESPONESE_OFFSET = 20
 
+# Edition qualifiers ignored when comparing album and track titles, e.g. "(Deluxe Edition)" or "- Remastered 2011"
+_EDITION_WORDS = r"\b(?:remaster(?:ed)?|deluxe|explicit|clean|edition|expanded|anniversary|bonus)\b"
+_EDITION_QUALIFIER = re.compile(rf"\s*[(\[][^)\]]*{_EDITION_WORDS}[^)\]]*[)\]]|\s+-\s+[^-]*{_EDITION_WORDS}.*$", re.IGNORECASE)
+
+
+# Callbacks of the on_requests blocks the current context is in
+_request_callbacks = contextvars.ContextVar("request_callbacks", default=())
+
+
+@contextmanager
+def on_requests(callback):
+    """
+    Context manager calling `callback()` before each request sent to the Spotify API inside its block (and in
+    the contexts copied from it, such as the album fetches of the workers). Data served from the store and the
+    response cache sends no request.
+    """
+    token = _request_callbacks.set(_request_callbacks.get() + (callback,))
+    try:
+        yield
+    finally:
+        _request_callbacks.reset(token)
+
+
+def normalize_title(title):
+    """
+    Returns an album or track title without its edition qualifiers, case and punctuation.
+    """
+    title = _EDITION_QUALIFIER.sub("", title or "")
+    return " ".join(re.sub(r"\W+", " ", title.casefold()).split())
+
+
+def album_edition_key(album):
+    """
+    Returns the key shared by the editions of an album: its normalized title, release date and number of tracks.
+    """
+    return normalize_title(album["name"]), album["release_date"], album.get("total_tracks")
+
+
+def track_key(name, artist_ids):
+    """
+    Returns the key shared by the copies of a song on several albums: its normalized title and its set of artists.
+    """
+    return normalize_title(name), frozenset(artist_ids)
+
+
+class CrawlCancelled(Exception):
+    """
+    Raised when a crawl is stopped by its should_stop callback before finishing.
+    """
+
+class _CollabState:
+    """
+    Accumulates the collaborations found while walking the albums of an artist.
+
+    Albums must be added in the order they are returned by the API, the
+    deduplication of tracks depends on it.
+    """
+    def __init__(self, artist_id):
+        self.artist_id = artist_id
+        self.total_artists = {}
+        self.registered_songs = {}
+        self.last_collab_artist = {}
+        self.ids_to_fetch = []
+        # Keys of the songs seen, a song released on several albums is only registered once
+        self.seen_tracks = set()
+        # Number of albums and tracks added, to report the progress of the crawl
+        self.albums_added = 0
+        self.tracks_added = 0
+        # Entries changed since the last delta, in the order they were first changed
+        self._changed_songs = {}
+        self._changed_counts = {}
+        self._changed_dates = {}
+        self._reported_ids = 0
+
+    @classmethod
+    def from_saved(cls, artist_id, total_artists, registered_songs, last_collab_artist):
+        """
+        Rebuilds the state of a previous crawl from its saved data so new albums can be merged into it.
+        """
+        state = cls(artist_id)
+        state.total_artists = total_artists
+        state.registered_songs = registered_songs
+        state.last_collab_artist = {key: dt.strptime(elem, '%Y-%m-%d') for key, elem in last_collab_artist.items()}
+        state.seen_tracks = {track_key(song["name"], song["artists"]) for song in registered_songs.values()}
+        # The saved data goes in the first delta
+        state._changed_songs = dict.fromkeys(registered_songs)
+        state._changed_counts = dict.fromkeys(total_artists)
+        state._changed_dates = dict.fromkeys(last_collab_artist)
+        return state
+
+    def add_album(self, album, tracks):
+        """
+        Registers the tracks of an album in which the artist takes part.
+
+        Args:
+            album (dict): Simplified album object as returned by artist_albums.
+            tracks (list): Simplified track objects of the album.
+        """
+        release_date_format = '%Y' if album["release_date_precision"] == "year" else '%Y-%m-%d'
+        release_date = dt.strptime(album['release_date'], release_date_format)
+        self.albums_added += 1
+        self.tracks_added += len(tracks)
+
+        for track in tracks:
+            artist_ids = [a["id"] for a in track['artists']]
+            key = track_key(track["name"], artist_ids)
+            if key in self.seen_tracks:
+                continue
+            self.seen_tracks.add(key)
+            if self.artist_id in artist_ids:
+                track_data = self.registered_songs.setdefault(track["id"], {
+                    "name": track["name"],
+                    "url": album["external_urls"]["spotify"],
+                    "artists": artist_ids,
+                    "collaborations": [],
+                    "thumbnail": album["images"][1]["url"],
+                    "preview": track["preview_url"],
+                    "release_date": release_date.strftime('%Y-%m-%d')
+                })
+                if artist_ids not in track_data["collaborations"]:
+                    track_data["collaborations"].append(artist_ids)
+                self._changed_songs[track["id"]] = None
+                for a_id in artist_ids:
+                    self.total_artists[a_id] = self.total_artists.get(a_id, 0) + 1
+                    self._changed_counts[a_id] = None
+                    if self.artist_id != a_id:
+                        self.last_collab_artist[a_id] = max(self.last_collab_artist.get(a_id, release_date), release_date)
+                        self._changed_dates[a_id] = None
+                        if a_id not in self.ids_to_fetch:
+                            self.ids_to_fetch.append(a_id)
+
+    def take_delta(self):
+        """
+        Returns the songs, counts and dates changed since the previous call, with their current values,
+        and the collaborators found since then. See SpotifyManager.iterArtistCollabs.
+        """
+        delta = {
+            "songs": {song_id: self.registered_songs[song_id] for song_id in self._changed_songs},
+            "total_artists": {a_id: self.total_artists[a_id] for a_id in self._changed_counts},
+            "last_collab_artist": {a_id: self.last_collab_artist[a_id].strftime('%Y-%m-%d') for a_id in self._changed_dates},
+            "new_artist_ids": self.ids_to_fetch[self._reported_ids:]
+        }
+        self._changed_songs, self._changed_counts, self._changed_dates = {}, {}, {}
+        self._reported_ids = len(self.ids_to_fetch)
+        return delta
+
+
+class CollabReducer:
+    """
+    Merges the deltas of SpotifyManager.iterArtistCollabs into the data returned by getArtistCollabs.
+
+    Deltas carry the current value of every entry they contain, so merging is a dictionary update
+    and the data can be read at any point of the crawl to render the graph found so far.
+    """
+    def __init__(self):
+        self.total_artists = {}
+        self.registered_songs = {}
+        self.last_collab_artist = {}
+        self.artist_response = None
+        self.artists_info = {}
+        self.done = False
+
+    def add(self, delta):
+        """
+        Merges a delta.
+        """
+        if "artist" in delta:
+            self.artist_response = delta["artist"]
+        self.registered_songs.update(delta.get("songs", {}))
+        self.total_artists.update(delta.get("total_artists", {}))
+        self.last_collab_artist.update(delta.get("last_collab_artist", {}))
+        self.artists_info.update(delta.get("artists_info", {}))
+        self.done = delta.get("done", False)
+
+    def result(self):
+        """
+        Returns the merged data, as the tuple of getArtistCollabs.
+        """
+        return self.total_artists, self.registered_songs, self.last_collab_artist, self.artist_response, self.artists_info
+
+
 class SpotifyManager:
-    def __init__(self, debug=False, country = "ES"):
-        load_dotenv()
-        client_id = os.getenv('clientID')
-        client_secret = os.getenv('clientSecret')
+    def __init__(self, debug=False, country = "ES", workers=1, batch_albums=True, response_cache=True, store=None,
+                 collab_index=True, client=None, governor=True, crawl_locks=True):
+        # A client can be given to use another backend, e.g. a fakeSpotify.FakeSpotify in benchmarks
+        if client is not None:
+            self.sp = client
+        else:
+            load_dotenv()
+            client_id = os.getenv('clientID')
+            client_secret = os.getenv('clientSecret')
 
-        if not client_id or not client_secret:
-            raise EnvironmentError("Environment variables 'clientID' or 'clientSecret' not found.")
+            if not client_id or not client_secret:
+                raise EnvironmentError("Environment variables 'clientID' or 'clientSecret' not found.")
 
 
-        try:
-            self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-                client_id=client_id,
-                client_secret=client_secret,
-                redirect_uri="http://localhost:8888/callback",
-                scope="user-library-read,user-follow-read,playlist-modify-public,playlist-modify-private"))
-        except Exception as e:
-            raise RuntimeError("Error authenticating with Spotify: " + str(e))    
+            try:
+                # Pooled keep-alive connections, and the 429 responses are left to the governor instead of spotipy's retries
+                self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    redirect_uri="http://localhost:8888/callback",
+                    scope="user-library-read,user-follow-read,playlist-modify-public,playlist-modify-private"),
+                    requests_session=build_session(pool_size=max(16, workers)))
+            except Exception as e:
+                raise RuntimeError("Error authenticating with Spotify: " + str(e))    
         self.debug = debug
         self.country = country
+        # Number of threads used to fetch album tracks, 1 keeps the serial behaviour
+        self.workers = max(1, workers)
+        # Resolve albums in groups through sp.albums instead of one album_tracks call per album
+        self.batch_albums = batch_albums
+        # Shared on-disk cache of album and artist responses, a ResponseCache instance can be given to customize it
+        if response_cache is True:
+            response_cache = ResponseCache()
+        self.cache = response_cache or None
+        # Crawled data of every artist, kept in a single database
+        self.store = store or ArtistStore()
+        # Global index of the collaborations of every crawl, a CollabIndex instance can be given to customize it
+        if collab_index is True:
+            collab_index = CollabIndex()
+        self.index = collab_index or None
+        # Rate limit and concurrency of the requests, shared by every manager of the process unless a RequestGovernor is given
+        if governor is True:
+            governor = shared_governor()
+        self.governor = governor or None
+        # Single-flight locks of the crawls, shared with the other processes using the same lock file
+        if crawl_locks is True:
+            crawl_locks = CrawlLocks()
+        self.crawl_locks = crawl_locks or None
+        # Number of requests sent to the Spotify API by this manager
+        self.api_calls = 0
+        self._api_calls_lock = threading.Lock()
         print("Spotify working")
 
 
+    def _request(self, endpoint, *args, **kwargs):
+        """
+        Calls an endpoint of the Spotify client through the governor, which paces the requests and retries the 429 errors.
+
+        Args:
+            endpoint (str): The name of the spotipy.Spotify method, e.g. "albums".
+        """
+        if self.governor is None:
+            return self._send(endpoint, *args, **kwargs)
+        return self.governor.call(self._send, endpoint, *args, **kwargs)
+
+    def _send(self, endpoint, *args, **kwargs):
+        """
+        Sends a single request to the Spotify client, counting and timing it.
+        """
+        with self._api_calls_lock:
+            self.api_calls += 1
+        for callback in _request_callbacks.get():
+            callback()
+        metrics.inc("spotify_api_calls_total", endpoint=endpoint)
+        try:
+            with metrics.timer("spotify_api_seconds", endpoint=endpoint):
+                return getattr(self.sp, endpoint)(*args, **kwargs)
+        except spotipy.SpotifyException as e:
+            metrics.inc("spotify_api_errors_total", endpoint=endpoint, status=e.http_status)
+            if e.http_status == 429:
+                metrics.inc("spotify_api_rate_limited_total", endpoint=endpoint)
+            raise
+
     def _get_artist_id_from_url(self, artist_id):
         if artist_id.startswith(ARTIST_URL_PREFIX):
             return artist_id[len(ARTIST_URL_PREFIX):len(ARTIST_URL_PREFIX) + 22]
         return artist_id
 
-    def _save_response(self, path, data):
-        utils.saveResponse(data, path)
+    def _iter_artist_albums(self, artist_id, progress=None):
+        """
+        Pages through the albums of an artist, skipping compilations.
+
+        Args:
+            artist_id (str): The ID of the artist.
+            progress (callable, optional): Called with the number of albums paged and the total after each page.
+
+        Yields:
+            dict: Simplified album objects in the order returned by the API.
+        """
+        # Count of albums retrieved for DEBUG purposes and progress reports
+        total_retrieved = 0
+
+        response = self._request("artist_albums", artist_id, limit=50, country=self.country, album_type="album,single,appears_on")
+        while response:
+            total_retrieved += len(response['items'])
+            if self.debug:
+                print(f"Obtained {response['offset']} / {response['total']} -> items: {len(response['items'])}, total: {total_retrieved}")
+            if progress:
+                progress(albums_paged=total_retrieved, albums_total=response['total'])
+
+            for album in response['items']:
+                # Skip compilation albums
+                if album['album_type'] == 'compilation':
+                    continue
+                yield album
+
+            response = self._request("next", response) if response['next'] else None
+
+    def _iter_album_chunks(self, artist_id, size, skip=(), should_stop=None, progress=None, on_duplicate=None):
+        """
+        Groups the albums of an artist in lists of at most `size` albums,
+        leaving out the albums whose ID is in `skip`.
+        Only the first edition of each album (see album_edition_key) is kept, the other editions are passed
+        to `on_duplicate` instead, so their tracks are never requested.
+        Raises CrawlCancelled before yielding a chunk if `should_stop` returns True.
+        """
+        chunk = []
+        editions = set()
+        for album in self._iter_artist_albums(artist_id, progress):
+            if album["id"] in skip:
+                continue
+            key = album_edition_key(album)
+            if key in editions:
+                metrics.inc("albums_deduplicated_total")
+                if on_duplicate:
+                    on_duplicate(album)
+                continue
+            editions.add(key)
+            chunk.append(album)
+            if len(chunk) == size:
+                if should_stop and should_stop():
+                    raise CrawlCancelled(artist_id)
+                yield chunk
+                chunk = []
+        if chunk:
+            if should_stop and should_stop():
+                raise CrawlCancelled(artist_id)
+            yield chunk
+
+    def _fetch_album_tracks(self, albums):
+        """
+        Retrieves the tracks of a group of albums.
+
+        When batching is enabled the albums are resolved with a single request to the
+        multi-album endpoint and the embedded track lists are used, paging only the
+        albums whose track list does not fit in the first page. Albums found in the
+        response cache are not requested.
+
+        Args:
+            albums (list): Simplified album objects, at most RESPONESE_OFFSET of them.
+
+        Returns:
+            list: One list of simplified track objects per album, in the same order.
+        """
+        endpoint = "albums" if self.batch_albums else "album_tracks"
+        cached = self.cache.get_many(endpoint, [album["id"] for album in albums]) if self.cache else {}
+        missing = [album for album in albums if album["id"] not in cached]
+        if self.cache:
+            metrics.inc("cache_requests_total", len(cached), cache="responses", endpoint=endpoint, result="hit")
+            metrics.inc("cache_requests_total", len(missing), cache="responses", endpoint=endpoint, result="miss")
+
+        fetched = {}
+        if missing and not self.batch_albums:
+            for album in missing:
+                fetched[album["id"]] = self._request("album_tracks", album["uri"])['items']
+        elif missing:
+            response = self._request("albums", [album["id"] for album in missing])
+            for album, full_album in zip(missing, response['albums']):
+                if not full_album:
+                    fetched[album["id"]] = []
+                    continue
+                page = full_album['tracks']
+                tracks = list(page['items'])
+                while page['next']:
+                    page = self._request("next", page)
+                    tracks.extend(page['items'])
+                fetched[album["id"]] = tracks
+
+        if self.cache:
+            self.cache.set_many(endpoint, fetched)
+        return [cached[album["id"]] if album["id"] in cached else fetched[album["id"]] for album in albums]
+
+    def _iter_artists(self, ids):
+        """
+        Retrieves the full artist objects of the given IDs, 50 per request.
+        Artists already in the response cache are not requested again, only the missing IDs are grouped in requests.
+
+        Args:
+            ids (list): The artist IDs.
+
+        Yields:
+            list: The artist objects found in the cache, then those of each request.
+        """
+        cached = self.cache.get_many("artists", ids) if self.cache else {}
+        missing = [a_id for a_id in ids if a_id not in cached]
+        if self.cache:
+            metrics.inc("cache_requests_total", len(cached), cache="responses", endpoint="artists", result="hit")
+            metrics.inc("cache_requests_total", len(missing), cache="responses", endpoint="artists", result="miss")
+        if cached:
+            yield [cached[a_id] for a_id in ids if a_id in cached]
+
+        for i in range(0, len(missing), 50):
+            ids_chunk = missing[i:i+50]
+            chunk_details = self._request("artists", ids_chunk)
+            fetched = {a_id: artist for a_id, artist in zip(ids_chunk, chunk_details['artists']) if artist}
+            if self.cache:
+                self.cache.set_many("artists", fetched)
+            yield list(fetched.values())
 
     def search_artist(self, query, limit=1):
         """
@@ -51,19 +433,27 @@ class SpotifyManager:
         
         Returns the first artist ID from the results or None if no results.
         """
-        results = self.sp.search(q=query, limit=limit, type='artist')
+        results = self._request("search", q=query, limit=limit, type='artist')
         items = results.get('artists', {}).get('items', [])
         
         return items[0]['id'] if items else None
 
-    def getArtistCollabs(self, artist_id, force=False):
+    def getArtistCollabs(self, artist_id, force=False, update=False, should_stop=None, progress=None):
         """
         Retrieves the artist collaborations for a given artist ID or name.
+        The album tracks are fetched concurrently when the manager was created with more than one worker.
+        Concurrent calls for an artist that is not stored, from any thread or process, wait for a single crawl of it.
 
         Args:
             artist_id (str): The ID or name of the artist.
             force (bool, optional): If True, forces the retrieval of artist collaborations even if the data already exists. 
                                     Defaults to False.
+            update (bool, optional): If True and the artist was already crawled, only the albums not processed before are
+                                     fetched and merged into the existing data. Defaults to False.
+            should_stop (callable, optional): Checked between album batches, when it returns True the crawl is abandoned
+                                              without saving anything and CrawlCancelled is raised.
+            progress (callable, optional): Called with keyword arguments describing the progress of the crawl:
+                                           stage, albums_paged, albums_total, albums_fetched and tracks_fetched.
 
         Returns:
             tuple: A tuple containing the following information:
@@ -73,6 +463,57 @@ class SpotifyManager:
                 - artist_response (dict): Information about the artist.
                 - artists_info (dict): Information about the collaborating artists.
         """
+        artist_id = self._resolve_artist_id(artist_id)
+        if not force and not update:
+            saved = self._load_saved(artist_id)
+            if saved:
+                if self.debug:
+                    print("Already existed")
+                return saved[:5]
+
+        reducer = CollabReducer()
+        for delta in self._iter_crawl(artist_id, force, update, should_stop, progress):
+            reducer.add(delta)
+        return reducer.result()
+
+    def iterArtistCollabs(self, artist_id, force=False, update=False, should_stop=None, progress=None):
+        """
+        Crawls the collaborations of an artist like getArtistCollabs, yielding them as they are found.
+
+        A delta is yielded after the first request and after each batch of albums, with the songs, song counts
+        and last collaboration dates changed by the batch (with their current values) and the IDs of the new
+        collaborators. The details of the collaborators follow, the cached ones in one delta and then one delta
+        per request. Merging every delta with a CollabReducer gives the data returned by getArtistCollabs, and
+        the data is saved before the last delta.
+        Stored artists are yielded in a single delta.
+
+        Closing the generator before the end abandons the crawl without saving anything, as should_stop does.
+
+        Args:
+            artist_id, force, update, should_stop, progress: See getArtistCollabs.
+
+        Yields:
+            dict: A delta with some of the keys:
+                - artist (dict): Information about the artist, in the first delta.
+                - songs (dict): The new or changed songs by track ID.
+                - total_artists (dict): The new number of songs of each artist changed.
+                - last_collab_artist (dict): The new date of the last collaboration of each artist changed.
+                - new_artist_ids (list): The collaborators found for the first time.
+                - artists_info (dict): Information about collaborators.
+                - done (bool): True in the last delta.
+        """
+        artist_id = self._resolve_artist_id(artist_id)
+        if not force and not update:
+            saved = self._load_saved(artist_id)
+            if saved:
+                yield self._saved_delta(saved)
+                return
+        yield from self._iter_crawl(artist_id, force, update, should_stop, progress)
+
+    def _resolve_artist_id(self, artist_id):
+        """
+        Returns the ID of an artist given by ID, link or name.
+        """
         # First, we'll attempt to determine if the input is a name or ID.
         # If the input does not start with the Spotify URL prefix and does not seem to have the format of a Spotify ID,
         # then we'll assume it's a name and try to search for it.
@@ -81,87 +522,127 @@ class SpotifyManager:
             if not searched_artist_id:
                 raise ValueError(f"No artist found for the query: {artist_id}")
             artist_id = searched_artist_id
+        return self._get_artist_id_from_url(artist_id)
 
+    def _iter_crawl(self, artist_id, force, update, should_stop, progress):
+        if self.crawl_locks is None:
+            yield from self._crawl_artist(artist_id, force, update, should_stop, progress)
+            return
+        # Concurrent requests for the same artist, from this process or another one, wait for a single crawl
+        with self.crawl_locks.hold(artist_id):
+            yield from self._crawl_artist(artist_id, force, update, should_stop, progress)
 
-        seen_preview_urls = set()
+    def _saved_delta(self, saved):
+        """
+        Returns the delta with the whole stored data of an artist.
+        """
+        total_artists, registered_songs, last_collab_artist, artist_response, artists_info = saved[:5]
+        return {"artist": artist_response, "songs": registered_songs, "total_artists": total_artists,
+                "last_collab_artist": last_collab_artist, "new_artist_ids": list(last_collab_artist),
+                "artists_info": artists_info, "done": True}
 
-        artist_id = self._get_artist_id_from_url(artist_id)
-        artist_folder = ARTIST_PATH.format(artist_id)
+    def _load_saved(self, artist_id):
+        """
+        Loads the stored data of an artist, with the list of its processed albums, or None if it was never crawled.
+        """
+        with metrics.timer("stage_seconds", stage="store_load"):
+            saved = self.store.load(artist_id, ["total_artists", "registered_songs", "last_collab",
+                                                "artist_data", "artist_info", "processed_albums"])
+        metrics.inc("cache_requests_total", cache="artist_store", endpoint="artist", result="hit" if saved else "miss")
+        return saved
 
-        if not force and os.path.exists(artist_folder):
+    def _crawl_artist(self, artist_id, force, update, should_stop, progress):
+        """
+        Crawls the collaborations of an artist and saves them, yielding the deltas of iterArtistCollabs.
+        Called with the crawl lock of the artist held, the data is only saved once the crawl is complete.
+        """
+        # Read again under the lock, the crawl that held it may have just saved the artist
+        saved = None if force else self._load_saved(artist_id)
+        if saved and not update:
+            metrics.inc("crawls_coalesced_total")
             if self.debug:
-                print("Already existed")
-            return tuple(utils.loadJson(os.path.join(artist_folder, f"{name}.json")) for name in 
-                        ["totalArtists", "registeredSongs", "lastCollab", "artistData", "artistInfo"])
-
-        os.makedirs(artist_folder, exist_ok=True)
-        total_artists, registered_songs, last_collab_artist = {}, {}, {}
-        ids_to_fetch = []
-        artist_response = self.sp.artist(artist_id)
+                print("Crawled by a concurrent request")
+            yield self._saved_delta(saved)
+            return
+
+        if saved and saved[5]:
+            # Incremental refresh, the saved data is extended with the albums released since the last crawl
+            saved_total, saved_songs, saved_last_collab, _, artists_info, processed_albums = saved
+            collabs = _CollabState.from_saved(artist_id, saved_total, saved_songs, saved_last_collab)
+        else:
+            collabs = _CollabState(artist_id)
+            processed_albums = {}
+            artists_info = {}
+
+        processed_at = dt.now().strftime('%Y-%m-%d %H:%M:%S')
+        albums_start = time.perf_counter()
+        if progress:
+            progress(stage="albums", artist_id=artist_id)
+        artist_response = self._request("artist", artist_id)
         artist_name = artist_response['name']
+        # Saved data of an incremental refresh
+        yield dict(collabs.take_delta(), artist=artist_response, artists_info=dict(artists_info))
 
-        # Count of albums retrieved for DEBUG purposes
-        total_retrieved = 0
+        # Albums are resolved RESPONESE_OFFSET at a time through the multi-album endpoint
+        chunk_size = RESPONESE_OFFSET if self.batch_albums else 1
 
-        first_iteration = True
-        response = None
+        def add_album(album, tracks):
+            collabs.add_album(album, tracks)
+            processed_albums[album["id"]] = processed_at
+            if progress:
+                progress(albums_fetched=collabs.albums_added, tracks_fetched=collabs.tracks_added)
 
-        while first_iteration or response['next']:
-            if first_iteration:
-                first_iteration = False
-                response = self.sp.artist_albums(artist_id, limit=50, country=self.country, album_type="album,single,appears_on") # ,
-            else:
-                response = self.sp.next(response)
-                     
-            if self.debug:
-                total_retrieved += len(response['items'])
-                print(f"Obtained {response['offset']} / {response['total']} -> items: {len(response['items'])}, total: {total_retrieved}")
+        def skip_edition(album):
+            # Marked as processed, the incremental refreshes do not fetch it either
+            processed_albums[album["id"]] = processed_at
 
-            for album in response['items']: 
-                # Skip compilation albums
-                if album['album_type'] == 'compilation':
-                    continue
-                
-                release_date_format = '%Y' if album["release_date_precision"] == "year" else '%Y-%m-%d'
-                release_date = dt.strptime(album['release_date'], release_date_format)
-                album_tracks = self.sp.album_tracks(album["uri"])
-
-                for track in album_tracks['items']:
-                    if track['preview_url'] in seen_preview_urls:
-                        continue
-                    seen_preview_urls.add(track['preview_url'])
-                    artist_ids = [a["id"] for a in track['artists']]
-                    if artist_id in artist_ids:
-                        track_data = registered_songs.setdefault(track["id"], {
-                            "name": track["name"],
-                            "url": album["external_urls"]["spotify"],
-                            "artists": artist_ids,
-                            "collaborations": [],
-                            "thumbnail": album["images"][1]["url"],
-                            "preview": track["preview_url"]
-                        })
-                        if artist_ids not in track_data["collaborations"]:
-                            track_data["collaborations"].append(artist_ids)
-                        for a_id in artist_ids:
-                            total_artists[a_id] = total_artists.get(a_id, 0) + 1
-                            if artist_id != a_id:
-                                last_collab_artist[a_id] = max(last_collab_artist.get(a_id, release_date), release_date)
-                                if a_id not in ids_to_fetch:
-                                    ids_to_fetch.append(a_id)
-
-        all_artist_details = []
-
-        for i in range(0, len(ids_to_fetch), 50):
-            ids_chunk = ids_to_fetch[i:i+50]
-            chunk_details = self.sp.artists(ids_chunk)
-            all_artist_details.extend(chunk_details['artists'])
-
-        artists_details = {'artists': all_artist_details}
-        
-        artists_info = {artist['id']: {"name": artist['name'],
-                                        "url": artist['images'][0]['url'] if artist['images'] else None, 
-                                        "genres": artist['genres'] if 'genres' in artist else []
-                                        } for artist in artists_details['artists']}           
+        album_chunks = self._iter_album_chunks(artist_id, chunk_size, processed_albums, should_stop, progress, skip_edition)
+        if self.workers > 1:
+            # Track listings are requested while the album pages are still being paged,
+            # results are then merged in album order so the output matches the serial path.
+            # Finished chunks are merged as soon as they are at the head of the queue, so the progress
+            # moves while paging, and at most two chunks per worker wait in the queue.
+            # The workers run in a copy of the caller's context, so they keep its request priority.
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            pending = deque()
+            try:
+                for albums in itertools.chain(album_chunks, [None]):
+                    if albums is not None:
+                        pending.append((albums, executor.submit(contextvars.copy_context().run, self._fetch_album_tracks,
+                                                                albums)))
+                    while pending and (albums is None or pending[0][1].done() or len(pending) > 2 * self.workers):
+                        head_albums, future = pending.popleft()
+                        for album, tracks in zip(head_albums, future.result()):
+                            add_album(album, tracks)
+                        yield collabs.take_delta()
+            finally:
+                # The fetches still queued are dropped when the consumer stops early
+                executor.shutdown(cancel_futures=True)
+        else:
+            for albums in album_chunks:
+                for album, tracks in zip(albums, self._fetch_album_tracks(albums)):
+                    add_album(album, tracks)
+                yield collabs.take_delta()
+
+        metrics.observe("stage_seconds", time.perf_counter() - albums_start, stage="albums")
+
+        total_artists = collabs.total_artists
+        registered_songs = collabs.registered_songs
+        last_collab_artist = collabs.last_collab_artist
+        # Only the collaborators not seen in a previous crawl need their details
+        ids_to_fetch = [a_id for a_id in collabs.ids_to_fetch if a_id not in artists_info]
+        if progress:
+            progress(stage="artists", artists_total=len(ids_to_fetch))
+
+        details_start = time.perf_counter()
+        for artists in self._iter_artists(ids_to_fetch):
+            chunk_info = {artist['id']: {"name": artist['name'],
+                                         "url": artist['images'][0]['url'] if artist['images'] else None,
+                                         "genres": artist['genres'] if 'genres' in artist else []
+                                         } for artist in artists}
+            artists_info.update(chunk_info)
+            yield {"artists_info": chunk_info}
+        metrics.observe("stage_seconds", time.perf_counter() - details_start, stage="artist_details")
 
         artists_info[artist_id] = {
             'name': artist_name,
@@ -170,9 +651,9 @@ class SpotifyManager:
         }
 
         last_collab_artist = {key: elem.strftime('%Y-%m-%d') for key, elem in last_collab_artist.items()}
-        self._save_response(os.path.join(artist_folder, "totalArtists.json"), total_artists)
-        self._save_response(os.path.join(artist_folder, "registeredSongs.json"), registered_songs)
-        self._save_response(os.path.join(artist_folder, "lastCollab.json"), last_collab_artist)
-        self._save_response(os.path.join(artist_folder, "artistData.json"), artist_response)
-        self._save_response(os.path.join(artist_folder, "artistInfo.json"), artists_info)
-        return total_artists, registered_songs, last_collab_artist, artist_response, artists_info
\ No newline at end of file
+        with metrics.timer("stage_seconds", stage="store_save"):
+            self.store.save(artist_id, total_artists, registered_songs, last_collab_artist, artist_response, artists_info, processed_albums)
+        if self.index:
+            with metrics.timer("stage_seconds", stage="index_update"):
+                self.index.add_crawl(artist_id, registered_songs, last_collab_artist, artists_info)
+        yield {"artists_info": {artist_id: artists_info[artist_id]}, "done": True}
\ No newline at end of file
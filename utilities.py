@@ -1,5 +1,9 @@
 import json, random, os
+import atexit
 import colorsys
+import hashlib
+import tempfile
+import threading
 
 class Utilities:
     def saveResponse(response, filename):
@@ -48,16 +52,20 @@ class Utilities:
         """
         norm_arr = []
         diff = t_max - t_min
-        diff_arr = max(arr) - min(arr)
+        arr_min = min(arr)
+        diff_arr = max(arr) - arr_min
+        if diff_arr == 0:
+            # Every value is the same, they all go to the bottom of the range
+            return [t_min for _ in arr]
         for i in arr:
-            temp = (((i - min(arr))*diff)/diff_arr) + t_min
+            temp = (((i - arr_min)*diff)/diff_arr) + t_min
             norm_arr.append(temp)
         return norm_arr
     
     @staticmethod
     def get_genre_color(genre, filename="data/genre_colors.json"):
         """
-        Retrieves the color associated with a given genre from a JSON file.
+        Retrieves the color associated with a given genre from the palette stored in a JSON file.
         
         Args:
             genre (str): The genre for which to retrieve the color.
@@ -67,18 +75,90 @@ class Utilities:
         Returns:
             str: The color associated with the given genre.
         """
-        if os.path.exists(filename):
-            with open(filename, "r") as f:
-                genre_colors = json.load(f)
-        else:
-            genre_colors = {}
+        return GenrePalette.for_file(filename).get(genre)
 
-        if genre not in genre_colors:
-            genre_colors[genre] = Utilities.random_color()
 
-            with open(filename, "w") as f:
-                json.dump(genre_colors, f)
+class GenrePalette:
+    """
+    Process-wide mapping of genres to colors.
 
-        return genre_colors[genre]
+    The palette file is read once, colors are then served from memory and new
+    genres are written back in batches, replacing the file atomically.
+    """
+    _palettes = {}
+    _palettes_lock = threading.Lock()
 
-                
\ No newline at end of file
+    def __init__(self, filename="data/genre_colors.json", deterministic=False, flush_every=20):
+        """
+        Parameters:
+            filename (str): The path to the JSON file containing genre-color mappings.
+            deterministic (bool): If True, new genres get a color derived from a hash of their name,
+                so every process picks the same color. Otherwise the color is random.
+            flush_every (int): Number of new genres kept in memory before writing the file.
+        """
+        self.filename = filename
+        self.deterministic = deterministic
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._colors = self._read()
+        self._pending = 0
+        atexit.register(self.flush)
+
+    @classmethod
+    def for_file(cls, filename="data/genre_colors.json", **kwargs):
+        """
+        Returns the shared palette of a file, creating it on first use.
+        """
+        with cls._palettes_lock:
+            if filename not in cls._palettes:
+                cls._palettes[filename] = cls(filename, **kwargs)
+            return cls._palettes[filename]
+
+    def _read(self):
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename, "r") as f:
+            return json.load(f)
+
+    def _new_color(self, genre):
+        if not self.deterministic:
+            return Utilities.random_color()
+        hue = int(hashlib.md5(genre.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        r, g, b = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
+        return '#%02X%02X%02X' % (int(r*255), int(g*255), int(b*255))
+
+    def get(self, genre):
+        """
+        Returns the color of a genre, assigning a new one if the genre is unknown.
+        """
+        color = self._colors.get(genre)
+        if color is not None:
+            return color
+
+        with self._lock:
+            if genre not in self._colors:
+                self._colors[genre] = self._new_color(genre)
+                self._pending += 1
+                if self._pending >= self.flush_every:
+                    self._flush()
+            return self._colors[genre]
+
+    def flush(self):
+        """
+        Writes the genres added since the last flush to the palette file.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        # Other processes may have added genres meanwhile, their colors take precedence
+        self._colors.update(self._read())
+        folder = os.path.dirname(self.filename) or "."
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._colors, f)
+        os.replace(tmp_path, self.filename)
+        self._pending = 0